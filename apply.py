@@ -8,6 +8,7 @@ import pytesseract
 # ========== LLM 呼び出し（OpenAI） ==========
 # 実運用では gpt-5 / gpt-4o などに差し替え
 from openai import OpenAI
+from srs.selection import select_cards, build_items
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # 復習エンジン・プロンプト（あなたが作った「完全版」）をここに格納
@@ -96,14 +97,12 @@ def serve_session():
         "accept_synonym_if_same_sense":True,
         "lang":"ja"
     }
-    payload = {
-        "now": now_ms(),
-        "config": cfg,
-        "words": st.session_state.WORDS,
-        "cards": st.session_state.CARDS
-    }
-    out = llm_json(SRS_SYSTEM_PROMPT, payload)
-    items = out.get("session",{}).get("items",[])
+    # 選定はローカルで決定的に行う（LLMにデッキ全体を送らない）
+    t = now_ms()
+    due = [c for c in st.session_state.CARDS if c["due_at"] <= t]
+    picked = select_cards(due, cfg)
+    heads = {c["word"] for c in picked}
+    items = build_items(picked, {w["headword"]: w for w in st.session_state.WORDS if w["headword"] in heads})
     st.session_state.DUE_NOW = items
     st.session_state.ANSWERS = []  # リセット
 
@@ -0,0 +1,68 @@
+# bench/decks.py
+# ベンチ用の合成データ：語彙・カード（1k/10k/100k）、OCR 風テキスト、単語帳ページ風の画像
+import io
+import random
+from typing import Any, Dict, List
+
+DAY_MS = 24 * 3600 * 1000
+TYPES = ["ja2en", "en2ja", "cloze", "contrast"]
+RESULTS = [None, "correct", "hard", "wrong"]
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def _headword(i: int) -> str:
+    # 重複しない英字の見出し語（抽出器のストップワードや品詞ラベルと重ならない長さ）
+    s = ""
+    i += 26 * 27
+    while i:
+        i, r = divmod(i, 26)
+        s = _LETTERS[r] + s
+    return "w" + s
+
+def make_words(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    words = []
+    for i in range(n):
+        h = _headword(i)
+        senses = [{"sense_id": f"{h}#{k}", "core_jp": "意味" * rnd.randint(1, 3), "frames": [f"{h} + NP"],
+                   "collocations": [f"{h} a problem"], "register": "neutral"} for k in range(rnd.randint(1, 3))]
+        pairs = [{"a": h, "b": _headword(rnd.randrange(n)), "meaning_delta": "差"}] if rnd.random() < 0.2 else []
+        words.append({"headword": h, "senses": senses, "contrast_pairs": pairs})
+    return words
+
+def make_cards(words: List[Dict[str, Any]], n: int, now: int, seed: int = 0) -> List[Dict[str, Any]]:
+    # due は過去30日〜未来30日に散らす（約半分が出題対象）
+    rnd = random.Random(seed)
+    cards = []
+    for i in range(n):
+        w = words[i % len(words)]
+        sense = rnd.choice(w["senses"])["sense_id"] if w["senses"] else None
+        cards.append({
+            "id": f"b_{i}", "word": w["headword"], "stage": rnd.randint(1, 5), "type": rnd.choice(TYPES),
+            "prompt": f"【和訳】{w['headword']}", "answer": w["senses"][0]["core_jp"] if w["senses"] else "",
+            "tags": {"sense_id": sense}, "due_at": now + rnd.randint(-30 * DAY_MS, 30 * DAY_MS),
+            "last_result": rnd.choice(RESULTS),
+        })
+    return cards
+
+def make_text(n_lines: int, start: int = 0) -> str:
+    # OCR 結果風：番号・見出し語・品詞・訳
+    return "\n".join(f"{i + 1}. {_headword(start + i)} v. 訳語{i}" for i in range(n_lines))
+
+def make_page(seed: int = 0, size=(3024, 4032)) -> bytes:
+    # スマホ撮影相当の JPEG（1200万画素）。文字の代わりに横線の行を描く
+    from PIL import Image, ImageDraw
+    rnd = random.Random(seed)
+    img = Image.new("RGB", size, (235, 232, 225))
+    d = ImageDraw.Draw(img)
+    y = 200
+    while y < size[1] - 200:
+        x = 150
+        while x < size[0] - 300:
+            w = rnd.randint(60, 300)
+            d.rectangle([x, y, x + w, y + 40], fill=(30, 30, 30))
+            x += w + rnd.randint(30, 80)
+        y += rnd.randint(90, 130)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
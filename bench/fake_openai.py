@@ -0,0 +1,90 @@
+# bench/fake_openai.py
+# chat.completions.create だけを真似るローカルの OpenAI 代役（ネットワークなし・遅延と応答サイズを指定できる）
+# 入力（分割された user メッセージ）を読んで、serve なら items、grade なら results、語彙補完なら words を返す
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace as NS
+from typing import Any, Dict, Iterator, List
+
+from srs import wire
+
+
+class FakeCompletions:
+    def __init__(self, latency_ms: float = 300.0, jitter_ms: float = 50.0, ttft_ms: float = 150.0,
+                 response_chars: int = 80, stream_chunks: int = 20, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ttft_ms = ttft_ms
+        self.response_chars = response_chars
+        self.stream_chunks = stream_chunks
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _sleep(self, ms: float):
+        with self._lock:
+            ms = max(0.0, ms + self._rnd.uniform(-self.jitter_ms, self.jitter_ms)) if ms else 0.0
+            self.calls += 1
+        time.sleep(ms / 1000)
+
+    def _respond(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        compact = wire.LEGEND in messages[0]["content"]
+        payload: Dict[str, Any] = {}
+        for m in messages[1:]:
+            payload.update(json.loads(m["content"]))
+        if compact:
+            payload = wire.decode(payload)
+        pad = "説明" * (self.response_chars // 2)
+        now = payload.get("now", 0)
+        if "headwords" in payload:
+            return {"words": [{
+                "headword": h,
+                "senses": [{"sense_id": f"{h}#main", "core_jp": pad[:8] or "訳", "frames": [f"{h} + NP"],
+                            "collocations": [f"{h} it"], "register": "neutral"}],
+                "contrast_pairs": [],
+            } for h in payload["headwords"]]}
+        if "user_answers" in payload:
+            cards = {c["id"]: c for c in payload.get("cards", [])}
+            out = {"mode": "grade", "results": [{
+                "card_id": a["card_id"], "result": "hard", "score": 0.7,
+                "rubric": {"form": "exact", "sense": "unknown", "context": "awkward", "register": "ok"},
+                "explanation": pad,
+                "next": {"stage": cards.get(a["card_id"], {}).get("stage", 1), "due_at": now + 24 * 3600 * 1000},
+                "followups": [],
+            } for a in payload["user_answers"]]}
+        else:
+            out = {"mode": "serve", "session": {"served_at": now, "items": [{
+                "card_id": c["id"], "stage": c.get("stage", 1), "type": c.get("type", "en2ja"),
+                "prompt": f"{c.get('word', '')} {pad}", "options": None,
+                "meta": {"word": c.get("word"), "signals": ["bench"]},
+            } for c in payload.get("cards", [])]}}
+        return wire.encode(out) if compact else out
+
+    def create(self, model: str = "", messages: List[Dict[str, str]] = (), stream: bool = False, **kw):
+        text = json.dumps(self._respond(list(messages)), ensure_ascii=False)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        usage = NS(prompt_tokens=prompt_tokens, completion_tokens=len(text) // 4,
+                   prompt_tokens_details=NS(cached_tokens=len(messages[0]["content"]) // 4))
+        if not stream:
+            self._sleep(self.latency_ms)
+            return NS(choices=[NS(message=NS(content=text))], usage=usage)
+        return self._stream(text, usage)
+
+    def _stream(self, text: str, usage) -> Iterator[Any]:
+        self._sleep(self.ttft_ms)
+        n = max(1, self.stream_chunks)
+        step = max(1, len(text) // n)
+        rest = max(0.0, self.latency_ms - self.ttft_ms) / n
+        for i in range(0, len(text), step):
+            yield NS(choices=[NS(delta=NS(content=text[i:i + step]))], usage=None)
+            if rest:
+                time.sleep(rest / 1000)
+        yield NS(choices=[], usage=usage)
+
+
+class FakeOpenAI:
+    # OpenAI() の代わりに渡す。client.chat.completions.create(...) だけを持つ
+    def __init__(self, **kw):
+        self.chat = NS(completions=FakeCompletions(**kw))
@@ -0,0 +1,202 @@
+# bench/run.py
+# ベンチマーク本体：合成デッキ（既定 1k/10k/100k）で取り込み・出題・採点・エクスポート/インポート・画像前処理を測る
+# OpenAI は bench.fake_openai の代役を使う（遅延・応答サイズは引数で指定）。結果は JSON で出力し、版ごとに比較できる
+#   python -m bench.run --sizes 1000,10000 --repeat 5 --out bench_results.json
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.decks import make_cards, make_page, make_text, make_words   # noqa: E402
+from bench.fake_openai import FakeOpenAI                                 # noqa: E402
+from srs import archive, llm, schedule, service                         # noqa: E402
+from srs.enrich import ENRICH_SYSTEM_PROMPT                              # noqa: E402
+from srs.imageprep import prepare                                        # noqa: E402
+from srs.metrics import METRICS                                          # noqa: E402
+from srs.model import Deck                                               # noqa: E402
+from srs.store import CardStore                                          # noqa: E402
+
+SCHEMA_VERSION = 1
+NOW = 1_750_000_000_000
+CFG = {
+    "algo": "leitner", "leitner_offsets_days": [1, 3, 7, 14, 30], "wrong_delay_hours": 12, "hard_delay_hours": 24,
+    "session_max": 20, "min_mix_ratio": {"ja2en": 0.25, "en2ja": 0.25, "cloze": 0.25, "contrast": 0.25},
+    "random_seed": 42, "accept_spelling_distance": 1, "accept_lemma": True, "accept_synonym_if_same_sense": True,
+    "lang": "ja", "serve_llm_phrasing": False, "payload_token_budget": 6000, "grade_chunk_size": 5,
+    "llm_max_concurrency": 4, "llm_rate_per_s": 1000.0,
+}
+SYSTEM = "bench"
+
+
+# ==============================
+# 計測
+# ==============================
+def measure(name: str, fn: Callable[[int], int], repeat: int, warmup: int = 1) -> Dict[str, Any]:
+    # fn(i) -> 処理件数。時間は tracemalloc なしで測り、最後に1回だけピークメモリを取る
+    for i in range(warmup):
+        fn(-1 - i)
+    times, units = [], 0
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        units += fn(i)
+        times.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    fn(repeat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    a = np.asarray(times)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {
+        "name": name, "repeat": repeat,
+        "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(a.mean()), 3),
+        "throughput_per_s": round(units / (a.sum() / 1000), 1) if a.sum() else None,
+        "peak_mem_kb": peak // 1024,
+    }
+
+
+# ==============================
+# シナリオ
+# ==============================
+def bench_deck(n: int, repeat: int, fake: FakeOpenAI, tmp: str) -> List[Dict[str, Any]]:
+    words = make_words(max(1, n // 2), seed=n)
+    cards = make_cards(words, n, NOW, seed=n)
+    store = CardStore(os.path.join(tmp, f"bench_{n}.db"))
+    deck = Deck(store)
+    out: List[Dict[str, Any]] = []
+
+    t0 = time.perf_counter()
+    deck.put_words(words)
+    deck.put_cards(cards)
+    out.append({"name": "load", "cards": n, "ms": round((time.perf_counter() - t0) * 1000, 1)})
+    t0 = time.perf_counter()
+    deck = Deck(store)
+    out.append({"name": "reload", "cards": n, "ms": round((time.perf_counter() - t0) * 1000, 1)})
+
+    call = lambda p: llm.chat_json(fake, SYSTEM, p)                  # noqa: E731
+    stream = lambda p: llm.chat_json_stream(fake, SYSTEM, p)         # noqa: E731
+    lines = 200
+    out.append(measure("bootstrap_from_text",
+                       lambda i: service.bootstrap(deck, make_text(lines, start=n + (i + 10) * lines), NOW),
+                       repeat))
+    enrich = lambda p: llm.chat_json_plain(fake, ENRICH_SYSTEM_PROMPT, p, mode="enrich")   # noqa: E731
+
+    def enrich_new(i: int) -> int:
+        # キャッシュなし（毎回 LLM を呼ぶ）で、取り込んだばかりの語をまとめて補完する
+        heads = service.bootstrap_words(deck, make_text(lines, start=n + (i + 1000) * lines), NOW)
+        return service.enrich(deck, CFG, heads, enrich)["words"]
+    out.append(measure("enrich_words", enrich_new, repeat))
+    out.append(measure("serve_session", lambda i: len(service.serve(deck, CFG, NOW, call)), repeat))
+    phr = {**CFG, "serve_llm_phrasing": True}
+    out.append(measure("serve_session_llm", lambda i: len(service.serve(deck, phr, NOW, call)), repeat))
+    out.append(measure("serve_session_stream", lambda i: len(list(service.serve_stream(deck, phr, NOW, stream))),
+                       repeat))
+
+    def grade(i: int) -> int:
+        # 半分はローカル採点で決まる解答、半分は LLM へ回る解答
+        due = deck.due_cards(NOW, limit=CFG["session_max"])
+        answers = [{"card_id": c["id"], "user_input": c["answer"] if k % 2 else "bench", "latency_ms": 5000}
+                   for k, c in enumerate(due)]
+        service.grade(deck, CFG, answers, NOW, call)
+        return len(answers)
+    out.append(measure("grade_session", grade, repeat))
+
+    sm2 = {**CFG, "algo": "sm2"}
+    out.append(measure("reschedule_all",
+                       lambda i: len(schedule.reschedule(deck.columns(), CFG, sm2)), repeat))
+
+    exported: Dict[str, bytes] = {}
+
+    def export(i: int) -> int:
+        buf = io.BytesIO()
+        r = archive.export_deck(deck, buf, NOW)
+        exported["data"], exported["checkpoint"] = buf.getvalue(), r["checkpoint"]
+        return r["cards"]
+    out.append(measure("export_json", export, repeat))
+
+    def export_delta(i: int) -> int:
+        # 全体のエクスポート以降に1セッション分を採点し、その変更だけを書き出す
+        grade(i)
+        return archive.export_changes(deck, io.BytesIO(), exported["checkpoint"], NOW)["cards"]
+    out.append(measure("export_changes", export_delta, repeat))
+
+    def import_(i: int) -> int:
+        target = CardStore(":memory:")
+        return archive.import_deck(target, io.BytesIO(exported["data"]))["cards"]
+    out.append(measure("import_json", import_, max(1, repeat // 2)))
+
+    # 起動：スナップショットから索引・列を戻し、その後の1セッション分のジャーナルだけを再生する
+    deck.snapshot(NOW)
+    grade(0)
+    t0 = time.perf_counter()
+    Deck(store)
+    out.append({"name": "recover", "cards": n, "ms": round((time.perf_counter() - t0) * 1000, 1)})
+    return out
+
+def bench_prepare(repeat: int) -> Dict[str, Any]:
+    pages = [make_page(seed=i) for i in range(3)]
+    return measure("ocr_prepare", lambda i: (prepare(pages[i % len(pages)]), 1)[1], repeat)
+
+
+# ==============================
+# 実行
+# ==============================
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return ""
+
+def main(argv=None) -> Dict[str, Any]:
+    ap = argparse.ArgumentParser(description="word-srs benchmarks")
+    ap.add_argument("--sizes", default="1000,10000,100000", help="カード枚数（カンマ区切り）")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--latency-ms", type=float, default=300.0, help="代役 API の応答遅延")
+    ap.add_argument("--ttft-ms", type=float, default=150.0, help="ストリーミング時の初回トークンまでの遅延")
+    ap.add_argument("--response-chars", type=int, default=80, help="1件あたりの説明文の長さ")
+    ap.add_argument("--skip-image", action="store_true")
+    ap.add_argument("--out", default="-", help="結果 JSON の出力先（- は標準出力）")
+    args = ap.parse_args(argv)
+
+    fake = FakeOpenAI(latency_ms=args.latency_ms, ttft_ms=args.ttft_ms, response_chars=args.response_chars)
+    result: Dict[str, Any] = {
+        "schema": SCHEMA_VERSION,
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "decks": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (int(x) for x in args.sizes.split(",") if x.strip()):
+            print(f"deck {n} …", file=sys.stderr)
+            result["decks"][str(n)] = bench_deck(n, args.repeat, fake, tmp)
+    if not args.skip_image:
+        print("image …", file=sys.stderr)
+        result["image"] = bench_prepare(args.repeat)
+    result["llm_calls"] = fake.chat.completions.calls
+    result["metrics"] = METRICS.summary()
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return result
+
+
+if __name__ == "__main__":
+    main()
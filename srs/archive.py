@@ -0,0 +1,226 @@
+# srs/archive.py
+# デッキのエクスポート/インポート（gzip 圧縮の NDJSON。1行1レコードで書き出し・読み込みともストリーミング）
+# 形式：1行目ヘッダ {"format":"word-srs","version":1,"schedule":{...},...} → {"t":"word","d":{...}} / {"t":"card","d":{...}} → 末尾 {"t":"end",...}
+# インポートは id（語彙は headword）単位のマージ。旧形式（{"words":[...],"cards":[...]} の JSON）も読める
+# 差分エクスポート：ヘッダの checkpoint（ストアのジャーナルの位置）以降に変わった語彙・カードと {"t":"delete"} だけを書く
+import gzip
+import io
+import json
+import re
+import zlib
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from srs.model import as_dict
+
+FORMAT = "word-srs"
+VERSION = 1
+IMPORT_CHUNK = 1000
+MAX_ERRORS = 20          # 要約に載せる不正レコードの数（件数自体はすべて数える）
+
+_ID_NUM_RE = re.compile(r"^[A-Za-z]+_(\d+)$")
+
+
+def _line(obj: Dict[str, Any]) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+# ==============================
+# エクスポート
+# ==============================
+def export_deck(store, fp: BinaryIO, now: int = 0, schedule: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    # fp へ直接書き出す（デッキ全体を文字列にしない）
+    # schedule は due を付けたときのスケジュール設定（取り込み側で自分の設定へ付け直すのに使う）
+    # checkpoint は書き始める前のジャーナルの位置（書いている間の変更は次の差分にも入る。取り込みは上書きなので重なってよい）
+    n_words = n_cards = 0
+    checkpoint = store.last_seq()
+    with gzip.GzipFile(fileobj=fp, mode="wb", compresslevel=6) as gz:
+        gz.write(_line({"format": FORMAT, "version": VERSION, "deck": getattr(store, "deck", ""),
+                        "exported_at": now, "schedule": schedule, "checkpoint": checkpoint}))
+        for w in store.iter_words():
+            gz.write(_line({"t": "word", "d": as_dict(w)}))
+            n_words += 1
+        for c in store.iter_cards():
+            gz.write(_line({"t": "card", "d": as_dict(c)}))
+            n_cards += 1
+        gz.write(_line({"t": "end", "words": n_words, "cards": n_cards}))
+    return {"words": n_words, "cards": n_cards, "checkpoint": checkpoint}
+
+def export_changes(store, fp: BinaryIO, since: int, now: int = 0,
+                   schedule: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, int]]:
+    # since（前回のエクスポートの checkpoint）より後の変更だけを書き出す。コストは変更の件数に比例する
+    # ジャーナルが詰められていて since から辿れなければ何も書かずに None（全体のエクスポートを使う）
+    ch = store.changes_since(since)
+    if ch is None:
+        return None
+    base = getattr(store, "store", store)   # Deck なら作業セットを通さずにストアから読む
+    n_words = n_cards = 0
+    with gzip.GzipFile(fileobj=fp, mode="wb", compresslevel=6) as gz:
+        gz.write(_line({"format": FORMAT, "version": VERSION, "deck": getattr(store, "deck", ""),
+                        "exported_at": now, "schedule": schedule, "since": since, "checkpoint": ch["upto"]}))
+        for i in range(0, len(ch["words"]), IMPORT_CHUNK):
+            for w in base.get_words(ch["words"][i:i + IMPORT_CHUNK]).values():
+                gz.write(_line({"t": "word", "d": as_dict(w)}))
+                n_words += 1
+        deleted = list(ch["deleted"])
+        for i in range(0, len(ch["cards"]), IMPORT_CHUNK):
+            part = ch["cards"][i:i + IMPORT_CHUNK]
+            found = base.get_cards(part)
+            for cid in part:
+                if cid in found:
+                    gz.write(_line({"t": "card", "d": as_dict(found[cid])}))
+                    n_cards += 1
+                else:
+                    deleted.append(cid)   # 書き出す前に消された
+        for cid in deleted:
+            gz.write(_line({"t": "delete", "d": {"id": cid}}))
+        gz.write(_line({"t": "end", "words": n_words, "cards": n_cards, "deleted": len(deleted)}))
+    return {"words": n_words, "cards": n_cards, "deleted": len(deleted), "checkpoint": ch["upto"]}
+
+
+# ==============================
+# 検証
+# ==============================
+def _check_word(d: Any) -> Optional[str]:
+    if not isinstance(d, dict) or not isinstance(d.get("headword"), str) or not d["headword"].strip():
+        return "headword がありません"
+    for k in ("senses", "contrast_pairs"):
+        if d.get(k) is not None and not isinstance(d[k], list):
+            return f"{k} が配列ではありません"
+    return None
+
+def _check_card(d: Any) -> Optional[str]:
+    if not isinstance(d, dict) or not isinstance(d.get("id"), str) or not d["id"]:
+        return "id がありません"
+    if not isinstance(d.get("word"), str):
+        return "word がありません"
+    if d.get("tags") is not None and not isinstance(d["tags"], dict):
+        return "tags がオブジェクトではありません"
+    try:
+        d["stage"] = int(d.get("stage") or 1)
+        d["due_at"] = int(d.get("due_at") or 0)
+    except (TypeError, ValueError):
+        return "stage / due_at が数値ではありません"
+    return None
+
+
+# ==============================
+# インポート
+# ==============================
+def _records(fp: BinaryIO) -> Iterator[Tuple[str, Any]]:
+    # (種類, 中身) を1件ずつ返す。gzip / 非圧縮 NDJSON / 旧 JSON を先頭バイトで見分ける
+    head = fp.read(2)
+    fp.seek(0)
+    stream: BinaryIO = gzip.GzipFile(fileobj=fp, mode="rb") if head == b"\x1f\x8b" else fp
+    first = stream.readline()
+    try:
+        header = json.loads(first)
+    except ValueError:
+        header = None
+    if not (isinstance(header, dict) and header.get("format") == FORMAT):
+        # 旧形式：1つの JSON（indent 付き）。この形式だけは全体を読み込む
+        rest = first + stream.read()
+        data = json.loads(rest.decode("utf-8"))
+        for w in data.get("words", []):
+            yield "word", w
+        for c in data.get("cards", []):
+            yield "card", c
+        yield "end", None
+        return
+    if int(header.get("version") or 0) > VERSION:
+        raise ValueError(f"未対応のバージョンです: {header.get('version')}")
+    yield "header", header
+    for raw in stream:
+        if not raw.strip():
+            continue
+        try:
+            rec = json.loads(raw)
+        except ValueError:
+            yield "error", "JSON として読めない行"
+            continue
+        if not isinstance(rec, dict):
+            yield "error", "レコードがオブジェクトではありません"
+        else:
+            yield rec.get("t"), rec.get("d", rec)
+
+def import_deck(store, fp: BinaryIO, on_progress: Optional[Callable[[int, int], None]] = None,
+                chunk: int = IMPORT_CHUNK,
+                on_cards: Optional[Callable[[List[str], Optional[Dict[str, Any]]], None]] = None) -> Dict[str, Any]:
+    # 読みながら chunk 件ずつ store へマージする（同じ id/headword は上書き、無いものは追加）
+    # on_progress(読み込んだバイト数, 全体のバイト数)
+    # 要約の schedule はエクスポート元のスケジュール設定（旧形式・不明なら None）
+    # on_cards(取り込んだ card_id, schedule) は chunk ごとに呼ぶ（id の一覧は要約に溜めない。メモリを件数に比例させない）
+    # 途中で切れた・壊れた gzip は complete=False で返す（それまでに書いた chunk は取り込まれたまま）
+    # 差分（delete レコードを含む）もそのまま適用できる。checkpoint はエクスポート元のジャーナルの位置
+    fp.seek(0, io.SEEK_END)
+    total = fp.tell()
+    fp.seek(0)
+    words: List[Dict[str, Any]] = []
+    cards: List[Dict[str, Any]] = []
+    deleted: List[str] = []
+    summary: Dict[str, Any] = {"words": 0, "cards": 0, "deleted": 0, "invalid": 0, "errors": [], "complete": False,
+                               "truncated": None, "schedule": None, "checkpoint": None}
+    max_id = 0
+
+    def flush():
+        if words:
+            store.put_words(words)
+            summary["words"] += len(words)
+            words.clear()
+        if cards:
+            store.put_cards(cards)
+            summary["cards"] += len(cards)
+            if on_cards:
+                on_cards([c["id"] for c in cards], summary["schedule"])
+            cards.clear()
+        if deleted:
+            store.delete_cards(deleted)
+            summary["deleted"] += len(deleted)
+            deleted.clear()
+        if on_progress:
+            on_progress(min(fp.tell(), total), total)
+
+    def invalid(n: int, msg: str):
+        summary["invalid"] += 1
+        if len(summary["errors"]) < MAX_ERRORS:
+            summary["errors"].append(f"{n}: {msg}")
+
+    try:
+        for n, (kind, d) in enumerate(_records(fp), start=1):
+            if kind == "word":
+                err = _check_word(d)
+                if err:
+                    invalid(n, err)
+                else:
+                    words.append(d)
+            elif kind == "card":
+                err = _check_card(d)
+                if err:
+                    invalid(n, err)
+                else:
+                    cards.append(d)
+                    m = _ID_NUM_RE.match(d["id"])
+                    if m:
+                        max_id = max(max_id, int(m.group(1)))
+            elif kind == "delete":
+                if isinstance(d, dict) and isinstance(d.get("id"), str) and d["id"]:
+                    deleted.append(d["id"])
+                else:
+                    invalid(n, "id がありません")
+            elif kind == "header":
+                summary["schedule"] = d.get("schedule") if isinstance(d.get("schedule"), dict) else None
+                summary["checkpoint"] = d.get("checkpoint")
+            elif kind == "end":
+                summary["complete"] = True
+            else:
+                invalid(n, d if kind == "error" else f"不明な種類: {kind}")
+            if len(words) + len(cards) + len(deleted) >= chunk:
+                flush()
+    except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+        # 圧縮データが途中で終わっている・壊れている：読めた分までで止める
+        summary["complete"] = False
+        summary["truncated"] = str(e) or type(e).__name__
+    flush()
+    # 取り込んだ連番 id を、今後の払い出しが追い越さないようにする
+    if max_id:
+        store.ensure_ids_above(max_id)
+    return summary
@@ -0,0 +1,120 @@
+# srs/cache.py
+# 内容アドレス型の応答キャッシュ（llm_json / OCR の前段）
+# メモリ上の LRU ＋ 任意のディスク層（SQLite。再起動後も残る）、TTL、ヒット/ミス計数
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key        TEXT PRIMARY KEY,
+    value      TEXT NOT NULL,
+    expires_at REAL,
+    used_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_used ON cache (used_at);
+"""
+
+
+def make_key(*parts: Any) -> str:
+    # bytes はそのまま、それ以外は正規化した JSON をハッシュする
+    h = hashlib.sha256()
+    for p in parts:
+        if isinstance(p, (bytes, bytearray, memoryview)):
+            h.update(b"b:")
+            h.update(bytes(p))
+        else:
+            h.update(b"j:")
+            h.update(json.dumps(p, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+def logical_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # now を除けば「同じ論理状態」とみなせる。serve は選定済みカードだけを送り、
+    # grade の次回 due は採点結果からローカルで決める（LLM の next は使わない）ので、どちらも now に依存しない
+    # （同じ解答の連打・再送を SingleFlight でまとめられる）
+    return {k: v for k, v in payload.items() if k != "now"}
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256, ttl_s: Optional[float] = None,
+                 disk_path: Optional[str] = None, max_disk_entries: int = 5000):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+        self.hits = self.disk_hits = self.misses = 0
+
+    def _expiry(self, ttl_s: Optional[float]) -> Optional[float]:
+        ttl = self.ttl_s if ttl_s is None else ttl_s
+        return time.time() + ttl if ttl else None
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                value, exp = hit
+                if exp is None or exp > now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+                del self._mem[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT value, expires_at FROM cache WHERE key=?", (key,)).fetchone()
+                if row and (row[1] is None or row[1] > now):
+                    self._db.execute("UPDATE cache SET used_at=? WHERE key=?", (now, key))
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+                if row:
+                    self._db.execute("DELETE FROM cache WHERE key=?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any, ttl_s: Optional[float] = None):
+        # 値は JSON で保持する（呼び出し側が結果を書き換えてもキャッシュは汚れない）
+        raw = json.dumps(value, ensure_ascii=False)
+        exp = self._expiry(ttl_s)
+        with self._lock:
+            self._remember(key, raw, exp)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO cache (key, value, expires_at, used_at) VALUES (?,?,?,?)",
+                                 (key, raw, exp, time.time()))
+                n = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+                if n > self.max_disk_entries:
+                    self._db.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used_at LIMIT ?)",
+                                     (n - self.max_disk_entries,))
+
+    def _remember(self, key: str, raw: str, exp: Optional[float]):
+        self._mem[key] = (raw, exp)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / total, 3) if total else 0.0,
+                "entries": len(self._mem),
+            }
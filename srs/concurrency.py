@@ -0,0 +1,78 @@
+# srs/concurrency.py
+# 上限つき並列実行とレート制限（LLM/OCR 呼び出しの並列化で共用）
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+
+class RateLimiter:
+    # トークンバケット。rate_per_s 件/秒、burst 件まで連続で通す
+    def __init__(self, rate_per_s: float, burst: int = 1):
+        self.rate = float(rate_per_s)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SingleFlight:
+    # 同じキーの呼び出しが実行中なら、新たに呼ばずにその結果（または例外）を待って共有する
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        # (結果, 相乗りしたか)
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+        if not leader:
+            return fut.result(), True
+        try:
+            res = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(res)
+            return res, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+def map_bounded(fn: Callable[[Any], Any], items: Iterable[Any], max_workers: int = 4,
+                limiter: Optional[RateLimiter] = None) -> Iterator[Tuple[Any, Any]]:
+    # 完了順に (item, 結果 or 例外) を返す。1件の失敗で他を止めない
+    def run(item):
+        if limiter is not None:
+            limiter.acquire()
+        return fn(item)
+
+    items = list(items)
+    if not items:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as ex:
+        futures = {ex.submit(run, it): it for it in items}
+        for fut in as_completed(futures):
+            try:
+                yield futures[fut], fut.result()
+            except Exception as e:
+                yield futures[fut], e
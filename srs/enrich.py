@@ -0,0 +1,130 @@
+# srs/enrich.py
+# 語彙の補完：取り込んだ見出し語（senses が空）に語義・型・コロケーション・対比ペアを LLM で埋める
+# 1回の呼び出しで複数語をまとめて送り、バッチは並列に投げる。結果は見出し語単位で共有キャッシュに置く
+# （キャッシュはプロセス・ディスク共通なので、よく出る語はサーバで1回だけ補完すればよい）
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from srs.cache import ResponseCache, make_key
+from srs.concurrency import RateLimiter, map_bounded
+from srs.extract import headword_key
+from srs.metrics import METRICS
+
+# call(payload) -> 出力JSON（読めなければ None）。ENRICH_SYSTEM_PROMPT は呼び出し側で束縛する
+EnrichLLM = Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+LEXICON_TTL_S = 90 * 24 * 3600   # 語彙は変わらないので応答キャッシュより長く持つ
+DEFAULT_BATCH_SIZE = 20
+MAX_ROUNDS = 2                    # 応答に欠けた語だけを1回送り直す
+
+ENRICH_SYSTEM_PROMPT = r"""
+あなたは英語学習者向けの語彙データ作成者です。入力 {"headwords":[...]} の各見出し語について、日本語話者が
+取り違えやすい語義の区別を重視して、次の JSON だけを返してください（前置き・説明文・コードフェンスは不要）。
+
+{"words":[{
+  "headword": 入力と同じ綴り,
+  "senses": [{"sense_id":"<headword>#<英小文字の短いラベル>", "core_jp":"中心となる訳（短く）",
+              "frames":["型（例: deal with + NP）"], "collocations":["よく使う組み合わせ"],
+              "register":"neutral|formal|informal|academic"}],
+  "contrast_pairs": [{"a":"<headword>", "b":"紛らわしい語", "meaning_delta":"意味の差",
+                      "collocation_delta":"結びつく語の差", "register_delta":"文体の差"}]
+}]}
+
+- senses は主要なものから最大3つ。頻度の低い語義・専門用語は省く
+- contrast_pairs は学習上意味のあるものだけ（0〜2件）
+- 入力のすべての見出し語を1回ずつ返す。分からない語は senses を空にする
+""".strip()
+
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+
+# ==============================
+# 検証
+# ==============================
+def _strs(v: Any) -> List[str]:
+    return [s.strip() for s in v if isinstance(s, str) and s.strip()] if isinstance(v, list) else []
+
+def _clean(headword: str, w: Any) -> Optional[Dict[str, Any]]:
+    # スキーマに合う部分だけを残した語彙エントリ。語義が1つも無ければ None（再送の対象）
+    if not isinstance(w, dict):
+        return None
+    senses, used = [], set()
+    for i, s in enumerate(w.get("senses") or []):
+        if not (isinstance(s, dict) and isinstance(s.get("core_jp"), str) and s["core_jp"].strip()):
+            continue
+        sid = s.get("sense_id") if isinstance(s.get("sense_id"), str) else ""
+        label = _SLUG_RE.sub("-", sid.split("#", 1)[-1].lower()).strip("-") or str(i + 1)
+        sid = f"{headword}#{label}"
+        if sid in used:
+            sid = f"{sid}-{i + 1}"
+        used.add(sid)
+        senses.append({
+            "sense_id": sid, "core_jp": s["core_jp"].strip(),
+            "frames": _strs(s.get("frames")), "collocations": _strs(s.get("collocations")),
+            "register": s.get("register") if isinstance(s.get("register"), str) else "neutral",
+        })
+    if not senses:
+        return None
+    pairs = []
+    for p in w.get("contrast_pairs") or []:
+        if isinstance(p, dict) and isinstance(p.get("b"), str) and p["b"].strip():
+            pairs.append({"a": headword, "b": p["b"].strip(),
+                          **{k: p[k] for k in ("meaning_delta", "collocation_delta", "register_delta")
+                             if isinstance(p.get(k), str)}})
+    return {"headword": headword, "senses": senses, "contrast_pairs": pairs}
+
+def _by_key(out: Any) -> Dict[str, Any]:
+    if not isinstance(out, dict) or not isinstance(out.get("words"), list):
+        return {}
+    return {headword_key(w["headword"]): w for w in out["words"]
+            if isinstance(w, dict) and isinstance(w.get("headword"), str)}
+
+
+# ==============================
+# 補完
+# ==============================
+def _cache_key(key: str, tag: str) -> str:
+    return make_key("lexicon", tag, key)
+
+def enrich_headwords(headwords: Iterable[str], call: EnrichLLM, cache: Optional[ResponseCache] = None,
+                     tag: str = "", batch_size: int = DEFAULT_BATCH_SIZE, max_workers: int = 4,
+                     limiter: Optional[RateLimiter] = None,
+                     on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Dict[str, Any]]:
+    # 見出し語 -> 語彙エントリ。補完できなかった語は含めない
+    # tag はモデル名など（モデルを変えたら別のキャッシュになる）
+    todo: Dict[str, str] = {}
+    for h in headwords:
+        todo.setdefault(headword_key(h), h)
+    found: Dict[str, Dict[str, Any]] = {}
+    if cache is not None:
+        for k, h in list(todo.items()):
+            hit = cache.get(_cache_key(k, tag))
+            if hit is not None:
+                # 大文字小文字・空白だけが違う綴り（Deal with / deal with）でも同じエントリを使う
+                found[h] = _clean(h, hit) or hit
+                del todo[k]
+        METRICS.incr("enrich.cache_hit", n=len(found))
+    total = len(todo)
+    done = 0
+    for _ in range(MAX_ROUNDS):
+        if not todo:
+            break
+        keys = list(todo)
+        batches = [keys[i:i + max(1, batch_size)] for i in range(0, len(keys), max(1, batch_size))]
+        for batch, out in map_bounded(lambda b: call({"headwords": [todo[k] for k in b]}), batches,
+                                      max_workers=max_workers, limiter=limiter):
+            got = {} if isinstance(out, Exception) else _by_key(out)
+            for k in batch:
+                entry = _clean(todo[k], got.get(k))
+                if entry is None:
+                    continue
+                found[todo[k]] = entry
+                if cache is not None:
+                    cache.put(_cache_key(k, tag), entry, ttl_s=LEXICON_TTL_S)
+                done += 1
+            if on_progress:
+                on_progress(done, total)
+        todo = {k: h for k, h in todo.items() if h not in found}
+    if todo:
+        METRICS.incr("enrich.missing", n=len(todo))
+    return found
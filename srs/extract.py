@@ -0,0 +1,89 @@
+# srs/extract.py
+# OCRテキスト → 見出し語の抽出（正規表現トークン化・小文字化・ストップワード除去・句動詞・例文行の除外）
+import re
+from typing import List
+
+# 行頭の番号・箇条書き記号（"12." "(3)" "・" "- " など）
+_BULLET_RE = re.compile(r"^\s*(?:[\(\[（]?\d+[\)\]）.:]?|[•・\-*●○□■☐✓]+)\s*")
+# 行頭の英語の並び（最大4語）。日本語・記号・発音記号が来たところで止める
+_LEAD_RE = re.compile(r"^([A-Za-z][A-Za-z'\-]*(?:[ \t]+[A-Za-z][A-Za-z'\-]*){0,3})")
+_SPACE_RE = re.compile(r"\s+")
+# 行頭の英語の並び全体と直後の文末記号（例文の行かどうかの判定用）
+_RUN_RE = re.compile(r"^([A-Za-z][A-Za-z'\-]*(?:[ \t,]+[A-Za-z][A-Za-z'\-]*)*)\s*([.!?])?")
+
+# 句動詞・群前置詞の2語目以降になりうる語
+PARTICLES = frozenset("""
+about across after against along around as at away back by down for from in into
+of off on onto out over through to together under up upon with without
+""".split())
+# 句の目的語プレースホルダ（"take care of A" の A / "one's" など）は句に含めない
+PLACEHOLDERS = frozenset(["a", "b", "sb", "sth", "someone", "something", "one's", "oneself", "do", "doing"])
+# 例文かどうかの語数に数えないプレースホルダ（大文字の A / B は冠詞の a と区別する）
+_SLOT_WORDS = frozenset(["A", "B", "sb", "sth", "someone", "something", "one's", "oneself"])
+# 見出し語にしない語（機能語と品詞ラベル）
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at by for from with as is are was were be been
+it its this that these those i you he she we they me him her us them my your our their
+not no yes so than then there here very
+n v vt vi adj adv prep conj pron aux int pl sing cf ex eg ie etc syn ant
+""".split())
+
+# 候補の1語目がこれなら例文・指示文の断片（"please deal with" / "the issue of"）
+IMPERATIVES = frozenset(["please", "let's", "lets", "let", "don't", "dont", "never", "kindly"])
+DETERMINERS = frozenset("""
+a an the this that these those my your his her its our their some any every each no another
+""".split())
+
+MIN_LEN, MAX_LEN = 2, 20
+MAX_HEAD_WORDS = 4       # これより長い英語の並びは例文の行
+
+
+def headword_key(headword: str) -> str:
+    # 重複判定のキー。大文字小文字と空白だけを揃える（語尾は畳み込まない：news と new、evening と even は別の語）
+    return _SPACE_RE.sub(" ", headword.strip()).casefold()
+
+def _sentence_line(line: str) -> bool:
+    # 英語が MAX_HEAD_WORDS 語を超えて続く、または3語以上で文末記号で終わる行は例文
+    # プレースホルダ（"take care of A  Aの世話をする" の A）は句の一部なので数えない
+    m = _RUN_RE.match(line)
+    if not m:
+        return False
+    n = sum(t not in _SLOT_WORDS for t in m.group(1).replace(",", " ").split())
+    return n > MAX_HEAD_WORDS or (n >= 3 and m.group(2) is not None)
+
+def _phrase(tokens: List[str]) -> str:
+    # 2語目以降に小辞があれば最後の小辞までを句として取る（"deal with" / "take care of" / "look forward to"）
+    # 無ければ1語目だけ（"issue n." の品詞ラベルや例文の続きは捨てる）
+    last = max((i for i, t in enumerate(tokens) if i > 0 and t in PARTICLES), default=0)
+    return " ".join(t for t in tokens[:last + 1] if t not in PLACEHOLDERS or t == tokens[0])
+
+def extract_headwords(text: str) -> List[str]:
+    words: List[str] = []
+    for line in text.splitlines():
+        line = _BULLET_RE.sub("", line, count=1)
+        m = _LEAD_RE.match(line)
+        if not m or _sentence_line(line):
+            continue
+        tokens = [t.strip("'-") for t in m.group(1).lower().split()]
+        tokens = [t for t in tokens if t]
+        if not tokens or tokens[0] in IMPERATIVES or tokens[0] in DETERMINERS:
+            continue
+        head = _phrase(tokens)
+        if " " not in head and tokens[0] in STOPWORDS:
+            # 機能語で始まる成句（"by the way" / "at least"）は並び全体を取る。1語だけなら捨てる
+            # 末尾の目的語プレースホルダだけ落とす（"in a word" の a は残す）
+            while len(tokens) > 1 and tokens[-1] in PLACEHOLDERS:
+                tokens.pop()
+            if len(tokens) == 1:
+                continue
+            head = " ".join(tokens)
+        if MIN_LEN <= len(tokens[0]) <= MAX_LEN:
+            words.append(head)
+    # 同一テキスト内の重複も同じキーで除く（最初の表記を残す）
+    seen, out = set(), []
+    for w in words:
+        k = headword_key(w)
+        if k not in seen:
+            seen.add(k)
+            out.append(w)
+    return out
@@ -0,0 +1,106 @@
+# srs/followups.py
+# フォローアップカードの増えすぎ防止：内容の指紋で重複をまとめ、語・語義ごとの上限を守り、身についたものは引退させる
+# 指紋は (word, type, sense_id, 正規化した prompt/answer)。語ごとの索引（cards_by_word）から引くので全件は読まない
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from srs.grading import normalize
+from srs.model import as_dict
+
+FOLLOWUP_PREFIX = "fu"
+FOLLOWUP_DELAY_MS = 3600 * 1000
+DEFAULT_MAX_PER_WORD = 6
+DEFAULT_MAX_PER_SENSE = 3
+DEFAULT_RETIRE_STAGE = 3      # この段階以上で正解したフォローアップは引退（削除）
+
+
+def is_followup(card: Dict[str, Any]) -> bool:
+    return str(card.get("id", "")).startswith(FOLLOWUP_PREFIX + "_")
+
+def _sense(card: Dict[str, Any]) -> Optional[str]:
+    return (card.get("tags") or {}).get("sense_id")
+
+def fingerprint(card: Dict[str, Any]) -> str:
+    key = "\x1f".join([normalize(card.get("word") or ""), card.get("type") or "", _sense(card) or "",
+                       normalize(card.get("prompt") or ""), normalize(card.get("answer") or "")])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def mastered(card: Dict[str, Any], cfg: Dict[str, Any]) -> bool:
+    return (is_followup(card) and card.get("last_result") == "correct"
+            and int(card.get("stage") or 1) >= int(cfg.get("followup_retire_stage", DEFAULT_RETIRE_STAGE)))
+
+
+class FollowupIndex:
+    # 採点1回分の作業用索引。対象の語の既存フォローアップを指紋・語・語義で数えておき、新しい候補を振り分ける
+    def __init__(self, cards: Iterable[Dict[str, Any]], cfg: Dict[str, Any]):
+        self.max_word = int(cfg.get("followup_max_per_word", DEFAULT_MAX_PER_WORD))
+        self.max_sense = int(cfg.get("followup_max_per_sense", DEFAULT_MAX_PER_SENSE))
+        self._by_fp: Dict[str, Dict[str, Any]] = {}
+        self._per_word: Dict[str, int] = {}
+        self._per_sense: Dict[str, int] = {}
+        for c in cards:
+            if is_followup(c):
+                self._add(c)
+
+    def _add(self, card: Dict[str, Any]):
+        self._by_fp.setdefault(fingerprint(card), card)
+        self._per_word[card["word"]] = self._per_word.get(card["word"], 0) + 1
+        s = _sense(card)
+        if s:
+            self._per_sense[s] = self._per_sense.get(s, 0) + 1
+
+    def remove(self, card: Dict[str, Any]):
+        fp = fingerprint(card)
+        if self._by_fp.get(fp) is not None and self._by_fp[fp]["id"] == card["id"]:
+            del self._by_fp[fp]
+        self._per_word[card["word"]] = max(0, self._per_word.get(card["word"], 0) - 1)
+        s = _sense(card)
+        if s:
+            self._per_sense[s] = max(0, self._per_sense.get(s, 0) - 1)
+
+    def offer(self, card: Dict[str, Any], now: int) -> Tuple[str, Optional[Dict[str, Any]]]:
+        # ("new", card) 追加してよい / ("merged", 既存) 同じ内容があるので既存を前倒し / ("capped", None) 上限で捨てる
+        fp = fingerprint(card)
+        if fp in self._by_fp:
+            # 既存カードは作業セットで共有されているので、書き換えずに写しを返す（ストアに書いてから差し替わる）
+            same = self._by_fp[fp] = dict(as_dict(self._by_fp[fp]))
+            same["due_at"] = min(int(same.get("due_at") or 0) or now + FOLLOWUP_DELAY_MS, now + FOLLOWUP_DELAY_MS)
+            same["stage"] = min(int(same.get("stage") or 1), int(card.get("stage") or 1))
+            return "merged", same
+        s = _sense(card)
+        if self._per_word.get(card["word"], 0) >= self.max_word or (s and self._per_sense.get(s, 0) >= self.max_sense):
+            return "capped", None
+        self._add(card)
+        return "new", card
+
+
+def compact(cards: Iterable[Dict[str, Any]], cfg: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    # 既存デッキの整理：(前倒しした残す側のカード, 削除する id)
+    # 身についたものは引退、同じ指紋は due の早い1枚に寄せ、上限を超えた分は段階の高い（身についている）順に落とす
+    keep: Dict[str, Dict[str, Any]] = {}
+    drop: List[str] = []
+    changed: Dict[str, Dict[str, Any]] = {}
+    for c in cards:
+        if not is_followup(c):
+            continue
+        if mastered(c, cfg):
+            drop.append(c["id"])
+            continue
+        fp = fingerprint(c)
+        other = keep.get(fp)
+        if other is None:
+            keep[fp] = c
+            continue
+        first, second = sorted((other, c), key=lambda x: (int(x.get("due_at") or 0), x["id"]))
+        if int(second.get("stage") or 1) < int(first.get("stage") or 1):
+            first["stage"] = second["stage"]
+            changed[first["id"]] = first
+        keep[fp] = first
+        drop.append(second["id"])
+        changed.pop(second["id"], None)
+    index = FollowupIndex((), cfg)
+    for c in sorted(keep.values(), key=lambda x: (int(x.get("stage") or 1), int(x.get("due_at") or 0), x["id"])):
+        if index.offer(c, 0)[0] == "capped":
+            drop.append(c["id"])
+            changed.pop(c["id"], None)
+    return list(changed.values()), drop
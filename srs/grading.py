@@ -0,0 +1,184 @@
+# srs/grading.py
+# grade の「語形（form）」層をローカルで判定する（SRS_SYSTEM_PROMPT【採点規則】A）
+# 判定できない解答（語義・文脈の判断が要るもの）は None を返し、LLM に回す
+import re
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+# 語義一致・文脈自然を前提にしたスコア（プロンプトのスコア例）
+FORM_SCORES = {"exact": 1.00, "lemma": 0.95, "typo": 0.90}
+FORM_EXPLANATIONS = {
+    "exact": "正解と完全一致。",
+    "lemma": "語形変化の違いのみ（見出し語形が一致）。",
+    "typo": "軽微な綴り誤り（許容範囲内）。",
+}
+# 語形だけでは判定できないタイプ（自由作文・理由説明）
+LLM_ONLY_TYPES = {"compose", "contrast"}
+
+_SPACE_RE = re.compile(r"\s+")
+_EDGE_PUNCT_RE = re.compile(r"^[\s\"'“”‘’.,!?;:。、！？]+|[\s\"'“”‘’.,!?;:。、！？]+$")
+_ALT_SPLIT_RE = re.compile(r"\s*[/／;；,，、|]\s*")
+
+
+def normalize(s: str) -> str:
+    s = _EDGE_PUNCT_RE.sub("", s or "")
+    return _SPACE_RE.sub(" ", s).lower()
+
+# 語尾が変化形に見えるが、それ自体が別の見出し語になっている語（語尾を外すと別語になる: news→new, evening→even）
+_LEXICALIZED = frozenset("""
+news series species means always sometimes perhaps besides towards afterwards backwards forwards upstairs
+downstairs indoors outdoors overseas nowadays politics physics economics mathematics ethics athletics lens
+glasses clothes trousers scissors thanks evening morning during nothing something anything everything
+wedding pudding darling ceiling
+""".split())
+_MIN_STEM = 3
+_VOWELS = "aeiouy"
+_VOWEL_RUN_RE = re.compile(r"[aeiouy]+")
+
+
+def _single_cvc(stem: str) -> bool:
+    # 1音節で 子音+母音+子音 で終わる（hop / hat / writ）。-e を落とした語幹（hoped→hop-e / hated→hat-e）とみなす
+    return (len(_VOWEL_RUN_RE.findall(stem)) == 1 and len(stem) >= 3 and stem[-1] not in _VOWELS + "wx"
+            and stem[-2] in _VOWELS and stem[-3] not in _VOWELS)
+
+def _bases(w: str) -> List[str]:
+    # 規則変化だけを戻した見出し語形の候補（先頭が第一候補）。不規則形・判別できない語はそのまま（LLM に任せる）
+    # 語幹は _MIN_STEM 文字以上で母音を含むこと（string→str, during→dur のような切り過ぎを防ぐ）
+    if len(w) <= 3 or not w.isascii() or w in _LEXICALIZED:
+        return [w]
+
+    def ok(stem: str) -> bool:
+        return len(stem) >= _MIN_STEM and any(ch in _VOWELS for ch in stem)
+
+    if w.endswith(("ies", "ied")) and ok(w[:-3]):
+        return [w[:-3] + "y"]
+    if w.endswith(("sses", "shes", "ches", "xes", "zes")) and ok(w[:-2]):
+        return [w[:-2]]
+    for suf in ("ing", "ed"):
+        stem = w[:-len(suf)]
+        if not (w.endswith(suf) and ok(stem)):
+            continue
+        if stem[-1] == stem[-2] and stem[-1] not in "lsz" + _VOWELS:
+            return [stem[:-1]]                   # hopping → hop
+        if _single_cvc(stem):
+            return [stem + "e"]                  # hoping → hope（hop ではない）
+        return [stem, stem + "e"] if stem[-1] not in _VOWELS else [stem]   # walked → walk / changed → change
+    if w.endswith("s") and not w.endswith(("ss", "us", "is")) and ok(w[:-1]):
+        return [w[:-1]]
+    return [w]
+
+def lemma(phrase: str) -> str:
+    return " ".join(_bases(w)[0] for w in normalize(phrase).split(" "))
+
+def lemma_match(a: str, b: str) -> bool:
+    # 語ごとに、自分自身か規則変化を戻した形のどれかが一致すれば同じ語形とみなす（hate と hat は別語のまま）
+    ta, tb = normalize(a).split(" "), normalize(b).split(" ")
+    return len(ta) == len(tb) and all(x == y or ({x, *_bases(x)} & {y, *_bases(y)}) for x, y in zip(ta, tb))
+
+def _inflection_letter(a: str, b: str) -> bool:
+    short, long_ = sorted((a, b), key=len)
+    return len(long_) == len(short) + 1 and long_.startswith(short) and long_[-1] in "sed"
+
+def _one_substitution(a: str, b: str) -> bool:
+    # 同じ長さで1字だけ違う（then/than, advice/advise, affect/effect）。別の実在語になりやすい
+    return len(a) == len(b) and sum(x != y for x, y in zip(a, b)) == 1
+
+def known_forms(words: Iterable[Dict[str, Any]], headwords: Iterable[str] = ()) -> Set[str]:
+    # 実在する語として知っている形（見出し語・対比ペアの両側）。これと一致する解答は綴り誤りとは見なさない
+    out = {normalize(h) for h in headwords}
+    for w in words:
+        out.add(normalize(w.get("headword") or ""))
+        for p in w.get("contrast_pairs") or []:
+            out.update(normalize(p.get(k) or "") for k in ("a", "b"))
+    out.discard("")
+    return out
+
+def edit_distance(a: str, b: str, max_d: int) -> int:
+    # 帯域つき Levenshtein。max_d を超えた時点で max_d+1 を返す
+    if a == b:
+        return 0
+    la, lb = len(a), len(b)
+    if abs(la - lb) > max_d:
+        return max_d + 1
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    prev = list(range(lb + 1))
+    for i in range(1, la + 1):
+        lo, hi = max(1, i - max_d), min(lb, i + max_d)
+        cur = [max_d + 1] * (lb + 1)
+        if lo == 1:
+            cur[0] = i
+        ca = a[i - 1]
+        for j in range(lo, hi + 1):
+            cost = 0 if ca == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+        if min(cur[lo - 1:hi + 1]) > max_d:
+            return max_d + 1
+        prev = cur
+    return min(prev[lb], max_d + 1)
+
+def grade_form(answer: str, user_input: str, cfg: Dict[str, Any], known: Set[str] = frozenset()) -> Optional[str]:
+    # 正解候補（"扱う/処理する" のような併記も許容）ごとに exact → lemma → typo の順で照合
+    # known: 実在語として知っている形（known_forms）。解答がそのどれかなら別の語を書いたとみなし typo にしない
+    got = normalize(user_input)
+    if not got:
+        return None
+    alts = [normalize(a) for a in _ALT_SPLIT_RE.split(answer or "") if normalize(a)]
+    best = None
+    for exp in alts:
+        if got == exp:
+            return "exact"
+        if not (exp.isascii() and got.isascii()):
+            continue
+        if cfg.get("accept_lemma", True) and lemma_match(got, exp):
+            best = "lemma"
+        elif best is None and len(exp) > 3:
+            # 短い語は1字違いでも別語になりやすいので LLM に回す
+            # 末尾の s / e / d だけの違い（news/new, hate/hat）・1字の置き換え（then/than）・知っている別の語
+            # （lose/loose, desert/dessert）は別語のことが多いので綴り誤りとは見なさない
+            d = int(cfg.get("accept_spelling_distance", 1))
+            if (d > 0 and got not in known and not _inflection_letter(got, exp)
+                    and not _one_substitution(got, exp) and edit_distance(got, exp, d) <= d):
+                best = "typo"
+    return best
+
+def label_for(score: float) -> str:
+    if score >= 0.90:
+        return "correct"
+    if score >= 0.60:
+        return "hard"
+    return "wrong"
+
+def grade_local(card: Dict[str, Any], ans: Dict[str, Any], now: int, cfg: Dict[str, Any],
+                known: Set[str] = frozenset()) -> Optional[Dict[str, Any]]:
+    if card.get("type") in LLM_ONLY_TYPES or not card.get("answer"):
+        return None
+    form = grade_form(card["answer"], ans.get("user_input", ""), cfg, known)
+    if form is None:
+        return None
+    score = FORM_SCORES[form]
+    result = label_for(score)
+    # next（次回の段階・due）は service.apply_results が srs.schedule で付ける
+    return {
+        "card_id": card["id"],
+        "result": result,
+        "score": score,
+        "rubric": {"form": form, "sense": "match", "context": "natural", "register": "ok"},
+        "explanation": FORM_EXPLANATIONS[form],
+        "followups": [],
+        "log": {"latency_ms": ans.get("latency_ms")},
+    }
+
+def split_answers(answers: List[Dict[str, Any]], card_map: Dict[str, Dict[str, Any]],
+                  now: int, cfg: Dict[str, Any], known: Set[str] = frozenset()):
+    # ローカルで確定した結果と、LLM 判定が必要な解答に振り分ける（不明 card_id は無視）
+    decided, pending = [], []
+    for a in answers:
+        card = card_map.get(a.get("card_id"))
+        if card is None:
+            continue
+        r = grade_local(card, a, now, cfg, known)
+        if r is None:
+            pending.append(a)
+        else:
+            decided.append(r)
+    return decided, pending
@@ -0,0 +1,85 @@
+# srs/imageprep.py
+# OCR 前の画像前処理：EXIF回転 → 縮小デコード → OCR向け解像度へ縮小 → グレースケール＋コントラスト正規化 → JPEG/WebP
+# プレビュー用の小さなサムネイルも別に作る
+import io
+import time
+from typing import Any, Dict, NamedTuple
+
+from PIL import Image, ImageOps
+
+from srs.metrics import METRICS
+
+OCR_MAX_SIDE = 1600      # 単語帳1ページの文字が潰れない程度
+THUMB_MAX_SIDE = 480
+MIMES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class PreparedImage(NamedTuple):
+    data: bytes           # OCR に送る画像
+    mime: str
+    thumb: bytes          # プレビュー用 JPEG
+    stats: Dict[str, Any]
+    phash: str = ""       # 重複ページ判定用の dHash（256bit を hex で）
+
+
+def dhash(img: Image.Image, size: int = 16) -> str:
+    # 差分ハッシュ：(size+1)×size に縮めて横隣の明暗を比べる。撮り直し程度の差ならほぼ一致する
+    # 単語帳のページ同士は低解像度だと似通うので 8×8 ではなく 16×16 を使う
+    small = img.convert("L").resize((size + 1, size), Image.BILINEAR)
+    px = list(small.getdata())
+    bits = 0
+    for y in range(size):
+        row = px[y * (size + 1):(y + 1) * (size + 1)]
+        for x in range(size):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "WEBP":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+def prepare(raw: bytes, max_side: int = OCR_MAX_SIDE, fmt: str = "JPEG", quality: int = 80,
+            grayscale: bool = True) -> PreparedImage:
+    t0 = time.perf_counter()
+    img = Image.open(io.BytesIO(raw))
+    src_size = img.size
+    if img.format == "JPEG":
+        # JPEG は DCT 段階で 1/2〜1/8 に縮小デコードできる（全画素を展開しない）
+        # draft は両辺が要求以上に残る最小の縮尺を選ぶので、正方形ではなく縦横比どおりの目標を渡す
+        # （4032×3024 に (1600, 1600) だと短辺が足りず等倍のまま。(1600, 1200) なら 2016×1512）
+        scale = max_side / max(src_size)
+        if scale < 1:
+            img.draft("L" if grayscale else "RGB",
+                      (max(1, int(src_size[0] * scale)), max(1, int(src_size[1] * scale))))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    if grayscale:
+        img = ImageOps.autocontrast(ImageOps.grayscale(img), cutoff=1)
+    else:
+        img = ImageOps.autocontrast(img.convert("RGB"), cutoff=1)
+    t1 = time.perf_counter()
+
+    data = _encode(img, fmt, quality)
+    thumb_img = img.copy()
+    thumb_img.thumbnail((THUMB_MAX_SIDE, THUMB_MAX_SIDE))
+    thumb = _encode(thumb_img, "JPEG", 70)
+    t2 = time.perf_counter()
+    METRICS.observe("image.decode", (t1 - t0) * 1000)
+    METRICS.observe("image.encode", (t2 - t1) * 1000)
+    return PreparedImage(data, MIMES.get(fmt, "image/jpeg"), thumb, {
+        "src_bytes": len(raw),
+        "out_bytes": len(data),
+        "saved_bytes": len(raw) - len(data),
+        "src_size": src_size,
+        "out_size": img.size,
+        "decode_ms": round((t1 - t0) * 1000, 1),
+        "encode_ms": round((t2 - t1) * 1000, 1),
+    }, dhash(img))
@@ -0,0 +1,72 @@
+# srs/jsonstream.py
+# ストリーミング応答から "items": [...] の各要素を、閉じた時点で取り出すインクリメンタルパーサ
+import json
+import re
+from typing import Any, Dict, List
+
+_ARRAY_START_RE = re.compile(r'"items"\s*:\s*\[')
+
+
+class ItemStreamParser:
+    def __init__(self, key: str = "items"):
+        self._start_re = _ARRAY_START_RE if key == "items" else re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buf = ""
+        self._pos = 0          # 次に走査する位置
+        self._in_array = False
+        self._done = False
+        self._depth = 0        # 配列内でのネスト深さ
+        self._in_str = False
+        self._esc = False
+        self._item_start = -1
+
+    @property
+    def text(self) -> str:
+        return self._buf
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._buf += chunk
+        out: List[Dict[str, Any]] = []
+        if self._done:
+            return out
+        if not self._in_array:
+            m = self._start_re.search(self._buf, max(0, self._pos - 16))
+            if not m:
+                self._pos = len(self._buf)
+                return out
+            self._in_array = True
+            self._pos = m.end()
+        buf = self._buf
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # items 配列の終端
+                    self._done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._item_start >= 0:
+                    try:
+                        item = json.loads(buf[self._item_start:i + 1])
+                        if isinstance(item, dict):
+                            out.append(item)
+                    except ValueError:
+                        pass
+                    self._item_start = -1
+            i += 1
+        self._pos = i
+        return out
@@ -0,0 +1,274 @@
+# srs/llm.py
+# LLM JSON 呼び出し（クライアントは呼び出し側から渡す）と呼び出しごとのトークン記録
+import copy
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from srs.payload import count_tokens
+from srs.cache import ResponseCache, make_key, logical_payload
+from srs.jsonstream import ItemStreamParser
+from srs import schema, wire
+from srs.concurrency import SingleFlight
+from srs.metrics import METRICS
+
+MODEL = "gpt-4o-mini"
+
+
+# ==============================
+# 呼び出し記録（プロセス内で共有。開発者向け表示用）
+# ==============================
+class CallLog:
+    def __init__(self, maxlen: int = 200):
+        self._lock = threading.Lock()
+        self._calls: deque = deque(maxlen=maxlen)
+
+    def add(self, rec: Dict[str, Any]):
+        with self._lock:
+            self._calls.append(rec)
+
+    def recent(self, n: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._calls)[-n:]
+
+CALL_LOG = CallLog()
+
+_TOKEN_KEYS = ("prompt_tokens", "cached_tokens", "completion_tokens")
+
+def _log_call(rec: Dict[str, Any]):
+    # 呼び出し記録に加え、所要時間・初回トークンまでの時間・トークン数を計測値として集計する
+    CALL_LOG.add(rec)
+    if rec.get("cached"):
+        METRICS.incr("llm.cache_hit", mode=rec["mode"])
+        return
+    METRICS.observe(f"llm.{rec['mode']}", rec["ms"], stream=bool(rec.get("stream")))
+    if rec.get("ttft_ms") is not None:
+        METRICS.observe("llm.ttft", rec["ttft_ms"])
+    for k in _TOKEN_KEYS:
+        if rec.get(k):
+            METRICS.incr(f"tokens.{k}", rec[k])
+
+
+def _usage(resp) -> Dict[str, int]:
+    u = getattr(resp, "usage", None)
+    details = getattr(u, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(u, "prompt_tokens", None),
+        "cached_tokens": getattr(details, "cached_tokens", None),
+        "completion_tokens": getattr(u, "completion_tokens", None),
+    }
+
+
+# ==============================
+# リクエストの並び（プロバイダ側のプロンプトキャッシュ向け）
+# ==============================
+# 先頭一致でキャッシュされるので、変わらないもの → 変わるものの順に並べる：
+#   system（＋短縮スキーマの凡例） → config と words（見出し語順） → now / cards / user_answers
+STATIC_KEYS = ("config", "words")
+
+def _stable(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+def build_messages(system_prompt: str, payload: Dict[str, Any], compact_wire: bool = False) -> List[Dict[str, str]]:
+    static = {k: payload[k] for k in STATIC_KEYS if k in payload}
+    if "words" in static:
+        static["words"] = sorted(static["words"], key=lambda w: w.get("headword", ""))
+    dynamic = {k: v for k, v in payload.items() if k not in STATIC_KEYS}
+    if compact_wire:
+        system_prompt = system_prompt.rstrip("\n") + "\n" + wire.LEGEND + "\n"
+        static, dynamic = wire.encode(static), wire.encode(dynamic)
+    return [
+        {"role":"system","content":system_prompt},
+        {"role":"user","content":_stable(static)},
+        {"role":"user","content":_stable(dynamic)},
+    ]
+
+def _log_tokens(messages: List[Dict[str, str]]) -> Dict[str, int]:
+    # est_static_tokens = キャッシュされうる先頭部分（system ＋ 静的入力）の概算
+    static = sum(count_tokens(m["content"]) for m in messages[:2])
+    return {"est_tokens": static + count_tokens(messages[2]["content"]), "est_static_tokens": static}
+
+# ==============================
+# 呼び出し（JSON モード → 修復 → 検証 → 欠けた分だけ再送）
+# ==============================
+MAX_RETRIES = 2
+BACKOFF_S = 0.5          # 再送前の待ち（0.5s → 1s …）
+JSON_MODE = {"type": "json_object"}
+
+_FLIGHTS = SingleFlight()
+
+def _call_once(client, system_prompt: str, payload: Dict[str, Any], model: str,
+               compact_wire: bool, now: int) -> Tuple[Dict[str, Any], List[str]]:
+    # 1回呼んで (検証済みの応答, 欠けた card_id)。読めなければ全件が欠け
+    mode = schema.mode_of(payload)
+    with METRICS.span("llm.serialize"):
+        messages = build_messages(system_prompt, payload, compact_wire)
+    t0 = time.perf_counter()
+    resp = client.chat.completions.create(
+        model=model,
+        temperature=0,
+        response_format=JSON_MODE,
+        messages=messages
+    )
+    _log_call({
+        "at": int(time.time() * 1000),
+        "mode": mode,
+        "wire": "compact" if compact_wire else "full",
+        **_log_tokens(messages),
+        **_usage(resp),
+        "ms": int((time.perf_counter() - t0) * 1000),
+    })
+    txt = (resp.choices[0].message.content or "").strip()
+    t1 = time.perf_counter()
+    out, repaired = schema.parse(txt)
+    if out is None:
+        METRICS.incr("llm.parse_fallback", mode=mode)
+        return schema.empty(mode, now), schema.asked_ids(payload)
+    if repaired:
+        METRICS.incr("llm.repaired", mode=mode)
+    if compact_wire:
+        out = wire.decode(out)
+    ok, missing = schema.validate(out, payload, now)
+    METRICS.observe("llm.parse", (time.perf_counter() - t1) * 1000, mode=mode)
+    if missing:
+        METRICS.incr("llm.invalid", len(missing), mode=mode)
+    return ok, missing
+
+def _call_with_retry(client, system_prompt: str, payload: Dict[str, Any], model: str,
+                     compact_wire: bool) -> Tuple[Dict[str, Any], bool]:
+    # (応答, 全件そろったか)。読めなかった・不正だった card_id の分だけを指数バックオフで再送する
+    mode = schema.mode_of(payload)
+    now = int(payload.get("now") or time.time() * 1000)
+    result = schema.empty(mode, now)
+    todo, missing = payload, schema.asked_ids(payload)
+    error: Optional[Exception] = None
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(BACKOFF_S * 2 ** (attempt - 1))
+            METRICS.incr("llm.retry", mode=mode, ids=len(missing))
+        try:
+            ok, missing = _call_once(client, system_prompt, todo, model, compact_wire, now)
+        except Exception as e:
+            error = e
+            continue
+        error = None
+        result = schema.merge(mode, result, ok)
+        if not missing:
+            return result, True
+        todo = schema.subset(todo, missing)
+    if error is not None and result == schema.empty(mode, now):
+        raise error   # 1件も得られず通信エラーで終わった → 呼び出し側で「採点できなかった」扱い
+    return result, False
+
+def chat_json(client, system_prompt: str, payload: Dict[str, Any], model: str = MODEL,
+              cache: Optional[ResponseCache] = None, compact_wire: bool = False) -> Dict[str, Any]:
+    mode = schema.mode_of(payload)
+    key = make_key("chat", model, system_prompt, logical_payload(payload))
+    if cache is not None:
+        # temperature=0 なので同じ入力には同じ応答を使い回す
+        hit = cache.get(key)
+        if hit is not None:
+            _log_call({"at": int(time.time() * 1000), "mode": mode, "cached": True})
+            return hit
+
+    def run() -> Dict[str, Any]:
+        out, complete = _call_with_retry(client, system_prompt, payload, model, compact_wire)
+        if complete and cache is not None:
+            cache.put(key, out)
+        return out
+
+    # 連打などで同じ入力が同時に来たら、実行中の1回の結果を共有する
+    out, shared = _FLIGHTS.do(key, run)
+    if shared:
+        METRICS.incr("llm.coalesced", mode=mode)
+        return copy.deepcopy(out)
+    return out
+
+
+def chat_json_plain(client, system_prompt: str, payload: Dict[str, Any], model: str = MODEL,
+                    mode: str = "plain") -> Optional[Dict[str, Any]]:
+    # SRS 以外の JSON 呼び出し（語彙の補完など）。JSON モード＋修復まで行い、検証・再送は呼び出し側に任せる
+    with METRICS.span("llm.serialize"):
+        messages = build_messages(system_prompt, payload)
+    t0 = time.perf_counter()
+    resp = client.chat.completions.create(
+        model=model,
+        temperature=0,
+        response_format=JSON_MODE,
+        messages=messages
+    )
+    _log_call({
+        "at": int(time.time() * 1000),
+        "mode": mode,
+        **_log_tokens(messages),
+        **_usage(resp),
+        "ms": int((time.perf_counter() - t0) * 1000),
+    })
+    out, repaired = schema.parse((resp.choices[0].message.content or "").strip())
+    if out is None or not isinstance(out, dict):
+        METRICS.incr("llm.parse_fallback", mode=mode)
+        return None
+    if repaired:
+        METRICS.incr("llm.repaired", mode=mode)
+    return out
+
+
+def chat_json_stream(client, system_prompt: str, payload: Dict[str, Any], model: str = MODEL,
+                     cache: Optional[ResponseCache] = None, compact_wire: bool = False) -> Iterator[Dict[str, Any]]:
+    # serve 用。session.items[] の要素を、生成が閉じたものから順に返す（スキーマに合わない要素は捨てる）
+    # 返らなかったカードは呼び出し側（service.serve_stream）がローカル文面で補うので、ここでは再送しない
+    key = None
+    if cache is not None:
+        key = make_key("chat", model, system_prompt, logical_payload(payload))
+        hit = cache.get(key)
+        if hit is not None:
+            _log_call({"at": int(time.time() * 1000), "mode": "serve", "cached": True})
+            yield from hit.get("session", {}).get("items", [])
+            return
+    with METRICS.span("llm.serialize"):
+        messages = build_messages(system_prompt, payload, compact_wire)
+    t0 = time.perf_counter()
+    stream = client.chat.completions.create(
+        model=model,
+        temperature=0,
+        stream=True,
+        stream_options={"include_usage": True},
+        response_format=JSON_MODE,
+        messages=messages
+    )
+    parser = ItemStreamParser(wire.KEYS["items"] if compact_wire else "items")
+    ttft = None
+    usage = {}
+    for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            usage = _usage(chunk)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        if delta and ttft is None:
+            ttft = int((time.perf_counter() - t0) * 1000)
+        for item in parser.feed(delta):
+            item = wire.decode(item) if compact_wire else item
+            if schema.valid_item(item, payload):
+                yield item
+            else:
+                METRICS.incr("llm.invalid", mode="serve", stream=True)
+    _log_call({
+        "at": int(time.time() * 1000),
+        "mode": "serve",
+        "stream": True,
+        "wire": "compact" if compact_wire else "full",
+        **_log_tokens(messages),
+        **usage,
+        "ttft_ms": ttft,
+        "ms": int((time.perf_counter() - t0) * 1000),
+    })
+    out, _ = schema.parse(parser.text.strip())
+    if out is None:
+        METRICS.incr("llm.parse_fallback", mode="serve", stream=True)
+        return
+    ok, missing = schema.validate(wire.decode(out) if compact_wire else out, payload, int(payload.get("now") or 0))
+    if key is not None and not missing:
+        cache.put(key, ok)
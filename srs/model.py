@@ -0,0 +1,597 @@
+# srs/model.py
+# 省メモリのカード/語彙モデル（__slots__）と、索引を更新し続けるインメモリのデッキ
+# 索引（word / sense_id）と列スナップショット（due_at / type / stage …）は変更のたびに差分更新し、作り直さない
+# カード・語彙の本体は上限つきの作業セット（LRU）にだけ置き、残りはストアから必要なときに読む
+# 起動時は索引と列をスナップショットから戻し、ストアのジャーナルのうちその後の分だけを再生する
+import io
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from srs.analytics import DeckColumns
+from srs.metrics import METRICS
+
+DEFAULT_MEMORY_CAP = 64 * 1024 * 1024   # 1デッキあたりの作業セットの上限（概算バイト）
+DEFAULT_SNAPSHOT_EVERY = 5000            # 前回のスナップショットからこの件数のイベントがたまったら取り直す
+SNAPSHOT_FORMAT = 1
+
+
+# ==============================
+# モデル
+# ==============================
+class _Record:
+    # 既存コード（card["stage"] / card.get("tags")）からそのまま使えるよう、辞書風アクセスも受け付ける
+    __slots__ = ("extra",)
+    FIELDS: tuple = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS or bool(self.extra and key in self.extra)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {f: getattr(self, f) for f in self.FIELDS}
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Card(_Record):
+    __slots__ = ("id", "word", "stage", "type", "prompt", "answer", "tags", "due_at", "last_result")
+    FIELDS = __slots__
+
+    def __init__(self, id: str, word: str, stage: int = 1, type: str = "en2ja", prompt: str = "",
+                 answer: str = "", tags: Optional[Dict[str, Any]] = None, due_at: int = 0,
+                 last_result: Optional[str] = None, extra: Optional[Dict[str, Any]] = None):
+        self.id = id
+        self.word = word
+        self.stage = stage
+        self.type = type
+        self.prompt = prompt
+        self.answer = answer
+        self.tags = tags or {}
+        self.due_at = int(due_at or 0)
+        self.last_result = last_result
+        self.extra = extra or None
+
+    @property
+    def sense_id(self) -> Optional[str]:
+        return self.tags.get("sense_id")
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Card":
+        extra = {k: v for k, v in d.items() if k not in cls.FIELDS}
+        return cls(**{k: d[k] for k in cls.FIELDS if k in d}, extra=extra)
+
+
+class Word(_Record):
+    __slots__ = ("headword", "senses", "contrast_pairs")
+    FIELDS = __slots__
+
+    def __init__(self, headword: str, senses: Optional[List[Dict[str, Any]]] = None,
+                 contrast_pairs: Optional[List[Dict[str, Any]]] = None, extra: Optional[Dict[str, Any]] = None):
+        self.headword = headword
+        self.senses = senses or []
+        self.contrast_pairs = contrast_pairs or []
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Word":
+        extra = {k: v for k, v in d.items() if k not in cls.FIELDS}
+        return cls(**{k: d[k] for k in cls.FIELDS if k in d}, extra=extra)
+
+
+def as_dict(x: Union[_Record, Dict[str, Any]]) -> Dict[str, Any]:
+    return x.to_dict() if isinstance(x, _Record) else x
+
+
+# ==============================
+# ID 払い出し（単調増加。ストアの連番から100件ずつ予約）
+# ==============================
+class IdAllocator:
+    def __init__(self, reserve, block: int = 100):
+        # reserve(n) -> 予約した連番の先頭。払い出しはプロセス内で単調増加・重複なし
+        self._reserve = reserve
+        self._block = block
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def next(self, prefix: str) -> str:
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._reserve(self._block)
+                self._end = self._next + self._block
+            n = self._next
+            self._next += 1
+        return f"{prefix}_{n}"
+
+
+# ==============================
+# 作業セット（容量つき LRU）
+# ==============================
+def approx_bytes(x: Any) -> int:
+    # sys.getsizeof の再帰和による概算（共有された文字列も毎回数えるので多めに出る）
+    n = sys.getsizeof(x)
+    if isinstance(x, _Record):
+        return n + sum(approx_bytes(getattr(x, f)) for f in x.FIELDS) + (approx_bytes(x.extra) if x.extra else 0)
+    if isinstance(x, dict):
+        return n + sum(approx_bytes(k) + approx_bytes(v) for k, v in x.items())
+    if isinstance(x, (list, tuple, set)):
+        return n + sum(approx_bytes(v) for v in x)
+    return n
+
+
+class WorkingSet:
+    # 上限（概算バイト）つきの LRU。あふれたら使われていない順に捨てる（本体はストアにあるので必要なら読み直す）
+    # スレッド安全ではない（Deck のロックの内側で使う）
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_CAP):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._items: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Any) -> Any:
+        e = self._items.get(key)
+        if e is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return e[0]
+
+    def put(self, key: Any, value: Any):
+        self.discard(key)
+        size = approx_bytes(value)
+        self._items[key] = (value, size)
+        self.bytes += size
+        self._evict()
+
+    def discard(self, key: Any):
+        e = self._items.pop(key, None)
+        if e is not None:
+            self.bytes -= e[1]
+
+    def clear(self):
+        self._items.clear()
+        self.bytes = 0
+
+    def resize(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def count(self, kind: str) -> int:
+        return sum(1 for k in self._items if k[0] == kind)
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._items) > 1:
+            _, (_, size) = self._items.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+
+# ==============================
+# デッキ（ストアの書き込みスルー・キャッシュ）
+# ==============================
+class Deck:
+    # CardStore と同じ呼び方で使える。書き込みはストアへそのまま反映
+    # 常駐させるのは索引（word / sense_id）と列スナップショット（due の検索にも使う）だけ
+    # カード・語彙の本体は作業セット（LRU）に載せ、無ければストアからまとめて読み込む
+    def __init__(self, store, max_bytes: int = DEFAULT_MEMORY_CAP):
+        self.store = store
+        self._lock = threading.RLock()
+        self._ws = WorkingSet(max_bytes)
+        self._by_word: Dict[str, Set[str]] = {}
+        self._indexed: Dict[str, tuple] = {}   # id -> 索引に載せたときの (word, sense_id)
+        self._headwords: Set[str] = set()
+        self._columns = DeckColumns()   # 列スナップショット（集計・出題の選定用。reload で作り、以後は差分更新）
+        self._listeners: List[Callable[[Optional[Set[str]]], None]] = []
+        self._pending: Optional[List[Tuple[Callable[[], None], Set[str]]]] = None   # batch の COMMIT 後に反映する分
+        self._gen = 0        # 作業セット・索引への反映の回数（ロックの外で読んだ行が古くなっていないかの確認用）
+        self._seq = 0        # 索引・列に反映済みのジャーナルの位置
+        self._snap_seq = 0   # 最後に取ったスナップショットの位置
+        self.recover()
+
+    def __getattr__(self, name: str):
+        # ID 払い出し・ページ記録・見出し語索引などはストアにそのまま任せる
+        if name == "store":
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    # ---------- トランザクション ----------
+    @contextmanager
+    def batch(self):
+        # ロックは常に Deck → ストアの順に取る（ストアの batch の内側で Deck のロックを待たない）
+        # 作業セット・索引・列への反映はストアが COMMIT してから行う（ROLLBACK なら何も反映しない）
+        with self._lock:
+            if self._pending is not None:
+                with self.store.batch():
+                    yield self
+                return
+            self._pending = []
+            try:
+                with self.store.batch():
+                    yield self
+                pending = self._pending
+            finally:
+                self._pending = None
+            changed: Set[str] = set()
+            for apply, ids in pending:
+                apply()
+                changed |= ids
+            if pending:
+                self._gen += 1
+        if changed:
+            self._notify(changed)
+
+    def _after_commit(self, apply: Callable[[], None], ids: Set[str] = frozenset()):
+        self._pending.append((apply, set(ids)))
+
+    # ---------- 変更通知（先読みの無効化など） ----------
+    def subscribe(self, fn: Callable[[Optional[Set[str]]], None]):
+        # fn(変更された card_id の集合)。None は「全体が変わった」
+        with self._lock:
+            self._listeners.append(fn)
+
+    def _notify(self, ids: Optional[Set[str]]):
+        for fn in list(self._listeners):
+            fn(ids)
+
+    def reload(self):
+        # 索引と列は全件を1回流して作り直す。本体は作業セットに載せない（使われたときに読む）
+        def cards():
+            for d in self.store.iter_cards():
+                c = Card.from_dict(d)
+                self._index(c)
+                yield c
+
+        with self._lock:
+            self._ws.clear(); self._by_word.clear()
+            self._indexed.clear(); self._headwords.clear()
+            # 読み始める前の位置を覚える（読んでいる間の書き込みは次の catch_up で再生される。再生は冪等）
+            self._seq = self.store.last_seq()
+            self._headwords.update(d["headword"] for d in self.store.iter_words())
+            self._columns = DeckColumns(cards())
+            self._gen += 1
+        self._notify(None)
+
+    # ---------- スナップショットとジャーナルの再生 ----------
+    def _dump(self) -> bytes:
+        ids = self._columns.ids
+        keys = [self._indexed[i] for i in ids]
+        buf = io.BytesIO()
+        np.savez_compressed(buf, format=np.asarray(SNAPSHOT_FORMAT), **self._columns.arrays(),
+                            word=np.asarray([k[0] or "" for k in keys], dtype=str),
+                            sense=np.asarray([k[1] or "" for k in keys], dtype=str),
+                            headwords=np.asarray(sorted(self._headwords), dtype=str))
+        return buf.getvalue()
+
+    def _restore(self, data: bytes):
+        with np.load(io.BytesIO(data), allow_pickle=False) as z:
+            if int(z["format"]) != SNAPSHOT_FORMAT:
+                raise ValueError(f"未対応のスナップショット形式です: {int(z['format'])}")
+            cols = DeckColumns.from_arrays(z)
+            words, senses, headwords = z["word"].tolist(), z["sense"].tolist(), z["headwords"].tolist()
+        self._ws.clear(); self._by_word.clear()
+        self._indexed.clear(); self._headwords.clear()
+        for i, word, sense in zip(cols.ids, words, senses):
+            self._indexed[i] = (word, sense or None)
+            self._by_word.setdefault(word, set()).add(i)
+        self._headwords.update(headwords)
+        self._columns = cols
+
+    def snapshot(self, now: int) -> int:
+        # 索引・列をストアに保存する（本体は保存しない。ストアの表にある）。保存した位置を返す
+        with self._lock:
+            self.catch_up()
+            seq, data = self._seq, self._dump()
+        self.store.save_snapshot(seq, data, now)
+        self._snap_seq = seq
+        return seq
+
+    def maybe_snapshot(self, now: int, every: int = DEFAULT_SNAPSHOT_EVERY) -> bool:
+        if self.store.last_seq() - self._snap_seq < every:
+            return False
+        self.snapshot(now)
+        return True
+
+    def recover(self):
+        # 最新のスナップショットから索引・列を戻し、その後のジャーナルだけを再生する（無い・読めなければ全件を読み直す）
+        snap = self.store.latest_snapshot()
+        with self._lock, METRICS.span("deck.recover") as a:
+            if snap is not None:
+                try:
+                    self._restore(snap[1])
+                    self._seq = self._snap_seq = snap[0]
+                    a["replayed"] = self.catch_up()
+                    return
+                except (ValueError, KeyError, OSError):
+                    METRICS.incr("deck.snapshot_invalid")
+            a["replayed"] = -1
+            self.reload()
+
+    def catch_up(self) -> int:
+        # 前回の位置より後の変更（別の接続・プロセスの書き込みも）だけを索引・列に反映する。反映した件数を返す
+        # 詰めた範囲より前なら全件を読み直す（-1）
+        with self._lock:
+            ch = self.store.changes_since(self._seq)
+            if ch is None:
+                self.reload()
+                return -1
+            found = self.store.get_cards(ch["cards"])
+            gone = set(ch["deleted"]) | (set(ch["cards"]) - set(found))
+            cards = [Card.from_dict(d) for d in found.values()]
+            for c in cards:
+                self._index(c)
+                self._ws.discard(("c", c.id))
+            for i in gone:
+                if i in self._indexed:
+                    self._unindex(i)
+                self._ws.discard(("c", i))
+            self._columns.remove(gone)
+            self._columns.extend(cards)
+            self._gen += 1
+            for h in ch["words"]:
+                self._headwords.add(h)
+                self._ws.discard(("w", h))
+            self._seq = ch["upto"]
+        changed = {c.id for c in cards} | gone
+        if changed:
+            self._notify(changed)
+        return len(changed) + len(ch["words"])
+
+    # ---------- 作業セット ----------
+    def _load(self, ids: List[str]) -> Dict[str, Card]:
+        # ids の順に返す。作業セットに無いものはストアから1回のクエリでまとめて読む
+        # ストアは Deck のロックを放してから読む（書き込み側は Deck → ストアの順にロックを取るので逆順にしない）
+        # 読んでいる間に書き込みが反映されたら、その行は古いかもしれないので読み直す
+        while True:
+            with self._lock:
+                found: Dict[str, Card] = {}
+                missing = []
+                for i in ids:
+                    if i not in self._indexed:
+                        continue
+                    c = self._ws.get(("c", i))
+                    if c is None:
+                        missing.append(i)
+                    else:
+                        found[i] = c
+                if not missing:
+                    return {i: found[i] for i in ids if i in found}
+                gen = self._gen
+            METRICS.incr("deck.page_in", n=len(missing))
+            rows = self.store.get_cards(missing)
+            with self._lock:
+                if self._gen != gen:
+                    continue
+                for i, d in rows.items():
+                    found[i] = c = Card.from_dict(d)
+                    self._ws.put(("c", i), c)
+                return {i: found[i] for i in ids if i in found}
+
+    def set_memory_cap(self, max_bytes: int):
+        with self._lock:
+            self._ws.resize(max_bytes)
+
+    def _index_bytes(self) -> int:
+        # 常駐の索引（word → id の集合・id → (word, sense_id)・見出し語）の概算。文字列は列・本体と共有なので数えない
+        return (sum(sys.getsizeof(d) + sum(sys.getsizeof(v) for v in d.values())
+                    for d in (self._by_word, self._indexed))
+                + sys.getsizeof(self._headwords))
+
+    def memory(self) -> Dict[str, Any]:
+        # bytes / max_bytes は作業セット（本体）だけ。index_bytes / columns_bytes は上限の外で常駐する分
+        with self._lock:
+            ws = self._ws
+            return {"bytes": ws.bytes, "max_bytes": ws.max_bytes,
+                    "index_bytes": self._index_bytes(), "columns_bytes": self._columns.nbytes(),
+                    "cards": ws.count("c"), "total_cards": len(self._indexed),
+                    "words": ws.count("w"), "total_words": len(self._headwords),
+                    "hits": ws.hits, "misses": ws.misses, "evictions": ws.evictions}
+
+    # ---------- 索引の差分更新 ----------
+    def _index(self, card: Card):
+        old = self._indexed.get(card.id)
+        key = (card.word, card.sense_id)
+        if old == key:
+            return
+        if old is not None:
+            self._unindex(card.id)
+        self._by_word.setdefault(card.word, set()).add(card.id)
+        self._indexed[card.id] = key
+
+    def _unindex(self, card_id: str):
+        word, _ = self._indexed.pop(card_id)
+        s = self._by_word.get(word)
+        if s is not None:
+            s.discard(card_id)
+            if not s:
+                del self._by_word[word]
+
+    # ---------- 語彙 ----------
+    def add_words(self, words: Iterable[Dict[str, Any]]) -> int:
+        words = [as_dict(w) for w in words]
+
+        def apply():
+            for w in words:
+                if w["headword"] not in self._headwords:
+                    self._headwords.add(w["headword"])
+                    self._ws.put(("w", w["headword"]), Word.from_dict(w))
+
+        with self.batch():
+            n = self.store.add_words(words)
+            self._after_commit(apply)
+        return n
+
+    def put_words(self, words: Iterable[Dict[str, Any]]):
+        words = [as_dict(w) for w in words]
+
+        def apply():
+            for w in words:
+                self._headwords.add(w["headword"])
+                self._ws.put(("w", w["headword"]), Word.from_dict(w))
+
+        with self.batch():
+            self.store.put_words(words)
+            self._after_commit(apply)
+
+    def get_words(self, headwords: Iterable[str]) -> Dict[str, Word]:
+        # _load と同じく、ストアは Deck のロックを放してから読む
+        headwords = list(headwords)
+        while True:
+            with self._lock:
+                found: Dict[str, Word] = {}
+                missing = []
+                for h in headwords:
+                    if h in found or h not in self._headwords:
+                        continue
+                    w = self._ws.get(("w", h))
+                    if w is None:
+                        missing.append(h)
+                    else:
+                        found[h] = w
+                if not missing:
+                    return found
+                gen = self._gen
+            METRICS.incr("deck.page_in", n=len(missing), kind="word")
+            rows = self.store.get_words(missing)
+            with self._lock:
+                if self._gen != gen:
+                    continue
+                for h, d in rows.items():
+                    found[h] = w = Word.from_dict(d)
+                    self._ws.put(("w", h), w)
+                return found
+
+    def iter_words(self) -> Iterator[Word]:
+        # 作業セットには載せずにストアから順に読む（エクスポート用）
+        return (Word.from_dict(d) for d in self.store.iter_words())
+
+    def count_words(self) -> int:
+        return len(self._headwords)
+
+    # ---------- カード ----------
+    def put_cards(self, cards: Iterable[Union[Card, Dict[str, Any]]]):
+        cards = [c if isinstance(c, Card) else Card.from_dict(c) for c in cards]
+
+        def apply():
+            for c in cards:
+                self._index(c)
+                self._ws.put(("c", c.id), c)
+            # 既存カードは行の書き換え、新しいカードは末尾に追加（作り直さない）
+            self._columns.extend(cards)
+
+        with self.batch():
+            self.store.put_cards([c.to_dict() for c in cards])
+            self._after_commit(apply, {c.id for c in cards})
+
+    def columns(self) -> DeckColumns:
+        return self._columns
+
+    def put_card(self, card: Union[Card, Dict[str, Any]]):
+        self.put_cards([card])
+
+    def delete_cards(self, ids: Iterable[str]):
+        ids = set(ids)
+        if not ids:
+            return
+
+        def apply():
+            for i in ids:
+                if i in self._indexed:
+                    self._unindex(i)
+                self._ws.discard(("c", i))
+            self._columns.remove(ids)
+
+        with self.batch():
+            self.store.delete_cards(ids)
+            self._after_commit(apply, ids)
+
+    def get_card(self, card_id: str) -> Optional[Card]:
+        with self._lock:
+            return self._load([card_id]).get(card_id)
+
+    def get_cards(self, ids: Iterable[str]) -> Dict[str, Card]:
+        with self._lock:
+            return self._load(list(ids))
+
+    def _due_rows(self, now: int) -> List[int]:
+        # 期限切れカードの列の行番号を (due_at, id) の昇順で（本体は読まない）
+        # due_at は NumPy で並べ、同じ due_at の組だけ id で並べ直す
+        cols = self._columns
+        rows = np.nonzero(cols.due_at <= now)[0]
+        order = np.argsort(cols.due_at[rows], kind="stable")
+        rows, due = rows[order].tolist(), cols.due_at[rows[order]].tolist()
+        out: List[int] = []
+        i = 0
+        while i < len(rows):
+            j = i + 1
+            while j < len(rows) and due[j] == due[i]:
+                j += 1
+            out += rows[i:j] if j - i == 1 else sorted(rows[i:j], key=lambda k: cols.ids[k])
+            i = j
+        return out
+
+    def due_cards(self, now: int, limit: Optional[int] = None) -> List[Card]:
+        # 本体を読むのは返す分（limit 件）だけ
+        with self._lock:
+            ids = self._columns.ids
+            return list(self._load([ids[k] for k in self._due_rows(now)[:limit]]).values())
+
+    def due_heads(self, now: int) -> List[Dict[str, Any]]:
+        # 出題の選定に使う列（id / due_at / type / stage / word / tags.sense_id）だけの軽い辞書
+        # 期限切れが作業セットの上限より多くても、本体をストアから読み直さずに選べる
+        with self._lock:
+            cols = self._columns
+            rows = self._due_rows(now)
+            out = []
+            tags: Dict[Optional[str], Dict[str, Any]] = {}   # 同じ sense_id の tags は1つを共有（読み取り専用）
+            for k, due, code, stage in zip(rows, cols.due_at[rows].tolist(), cols.type_code[rows].tolist(),
+                                            cols.stage[rows].tolist()):
+                i = cols.ids[k]
+                word, sense = self._indexed[i]
+                t = tags.get(sense)
+                if t is None:
+                    t = tags[sense] = {"sense_id": sense}
+                out.append({"id": i, "due_at": due, "type": cols.types[code], "stage": stage, "word": word, "tags": t})
+            return out
+
+    def cards_by_word(self, word: str) -> List[Card]:
+        with self._lock:
+            return list(self._load(list(self._by_word.get(word, ()))).values())
+
+    def iter_cards(self) -> Iterator[Card]:
+        # 作業セットには載せずにストアから順に読む（エクスポート・列の作り直し用）
+        return (Card.from_dict(d) for d in self.store.iter_cards())
+
+    def count_cards(self) -> int:
+        return len(self._indexed)
@@ -0,0 +1,139 @@
+# srs/ocr.py
+# OCR エンジンの差し替え口：Vision（OpenAI）/ Tesseract（ローカル）/ ローカル優先ハイブリッド
+# Tesseract はプロセスプールで回し、Streamlit のスクリプト実行を止めない
+import io
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from srs.metrics import METRICS
+
+try:
+    import pytesseract
+except ImportError:  # ローカルOCRは任意（未導入なら Vision のみ）
+    pytesseract = None
+
+ENGINES = ["hybrid", "vision", "tesseract"]
+
+
+class OcrResult(NamedTuple):
+    text: str
+    confidence: Optional[float]   # 0..100（Tesseract の単語信頼度の平均）。Vision は None
+    engine: str
+
+
+class OcrEngine:
+    name = "base"
+
+    def recognize(self, data: bytes, mime: str = "image/jpeg") -> OcrResult:
+        raise NotImplementedError
+
+    def __call__(self, data: bytes, mime: str = "image/jpeg") -> str:
+        # service.import_pages などの ocr(bytes, mime) -> str として使えるように
+        return self.recognize(data, mime).text
+
+
+class VisionOcr(OcrEngine):
+    name = "vision"
+
+    def __init__(self, fn: Callable[[bytes, str], str]):
+        self._fn = fn
+
+    def recognize(self, data: bytes, mime: str = "image/jpeg") -> OcrResult:
+        with METRICS.span("ocr.vision"):
+            return OcrResult(self._fn(data, mime), None, self.name)
+
+
+# ==============================
+# Tesseract（別プロセスで実行）
+# ==============================
+def _tesseract_ocr(data: bytes, lang: str) -> Tuple[str, Optional[float]]:
+    # プロセスプールから呼ぶのでモジュール直下に置く
+    from PIL import Image
+    img = Image.open(io.BytesIO(data))
+    # 言語モデルは英+日。jpn の言語パックが無ければ eng にフォールバック
+    try:
+        d = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+    except pytesseract.TesseractError:
+        d = pytesseract.image_to_data(img, lang="eng", output_type=pytesseract.Output.DICT)
+    lines: dict = {}
+    confs = []
+    for i, word in enumerate(d["text"]):
+        conf = float(d["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        confs.append(conf)
+        key = (d["block_num"][i], d["par_num"][i], d["line_num"][i])
+        lines.setdefault(key, []).append(word)
+    text = "\n".join(" ".join(ws) for _, ws in sorted(lines.items()))
+    return text, (sum(confs) / len(confs) if confs else None)
+
+
+class TesseractOcr(OcrEngine):
+    name = "tesseract"
+
+    def __init__(self, lang: str = "eng+jpn", max_workers: int = 2):
+        self.lang = lang
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._available: Optional[bool] = None
+
+    def available(self) -> bool:
+        # tesseract バイナリの有無は1回だけ確かめる
+        if self._available is None:
+            try:
+                self._available = pytesseract is not None and bool(pytesseract.get_tesseract_version())
+            except Exception:
+                self._available = False
+        return self._available
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def recognize(self, data: bytes, mime: str = "image/jpeg") -> OcrResult:
+        with METRICS.span("ocr.tesseract"):
+            text, conf = self._executor().submit(_tesseract_ocr, data, self.lang).result()
+        return OcrResult(text, conf, self.name)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+class HybridOcr(OcrEngine):
+    # ローカルで読んで、信頼度が低い/ほぼ読めないときだけ Vision に回す
+    name = "hybrid"
+
+    def __init__(self, local: TesseractOcr, remote: VisionOcr, min_confidence: float = 75.0,
+                 min_chars: int = 10):
+        self.local = local
+        self.remote = remote
+        self.min_confidence = min_confidence
+        self.min_chars = min_chars
+
+    def recognize(self, data: bytes, mime: str = "image/jpeg") -> OcrResult:
+        try:
+            r = self.local.recognize(data, mime)
+        except Exception:
+            return self.remote.recognize(data, mime)
+        if r.confidence is not None and r.confidence >= self.min_confidence and len(r.text.strip()) >= self.min_chars:
+            return r
+        METRICS.incr("ocr.hybrid_fallback")
+        return self.remote.recognize(data, mime)
+
+
+def make_engine(kind: str, vision_fn: Callable[[bytes, str], str], local: Optional[TesseractOcr] = None,
+                min_confidence: float = 75.0) -> OcrEngine:
+    # Tesseract が使えない環境（未導入・バイナリ無し）では Vision に落とす
+    remote = VisionOcr(vision_fn)
+    if kind == "vision" or local is None or not local.available():
+        return remote
+    if kind == "tesseract":
+        return local
+    return HybridOcr(local, remote, min_confidence)
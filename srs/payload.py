@@ -0,0 +1,118 @@
+# srs/payload.py
+# llm_json に渡す入力JSONの組み立て（必要なカード/語だけに絞り、空フィールドを落とし、トークン予算を守る）
+import json
+from typing import Dict, Any, List, Tuple, Optional
+
+from srs.model import as_dict
+
+try:
+    import tiktoken
+    _ENC = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken 未導入/辞書取得不可なら概算で数える
+    _ENC = None
+
+# SRS_SYSTEM_PROMPT の入力スキーマにある config キー（アプリ内部用の設定は送らない）
+# スケジューリングの設定（algo / 間隔 / 遅延）は srs.schedule がローカルで使うだけなので送らない
+PROMPT_CONFIG_KEYS = (
+    "session_max", "min_mix_ratio", "random_seed", "accept_spelling_distance", "accept_lemma",
+    "accept_synonym_if_same_sense", "lang",
+)
+# カードのうち LLM の判断に要らない列（次回の due と SM-2 の状態）
+LOCAL_CARD_KEYS = ("due_at", "sm2")
+DEFAULT_TOKEN_BUDGET = 6000
+
+Payload = Tuple[Dict[str, Any], int]
+
+
+def dumps(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+def count_tokens(text: str) -> int:
+    if _ENC is not None:
+        return len(_ENC.encode(text))
+    # 概算：ASCII は4文字≒1トークン、日本語などは1文字≒1トークン
+    ascii_n = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_n + 3) // 4 + (len(text) - ascii_n)
+
+def compact(obj: Any) -> Any:
+    # None / "" / [] / {} を再帰的に落とす（0 と False は残す）
+    obj = as_dict(obj)
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            v = compact(v)
+            if v is None or v == "" or v == [] or v == {}:
+                continue
+            out[k] = v
+        return out
+    if isinstance(obj, list):
+        return [compact(v) for v in obj]
+    return obj
+
+def prompt_config(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: cfg[k] for k in PROMPT_CONFIG_KEYS if k in cfg}
+
+def _card_view(card: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in as_dict(card).items() if k not in LOCAL_CARD_KEYS}
+
+def _words_for(cards: List[Dict[str, Any]], words_by_head: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # 見出し語順に並べる（同じ語の組なら毎回同じ並び・同じバイト列になる）
+    heads = sorted({c.get("word") for c in cards if c.get("word") in words_by_head})
+    return [words_by_head[h] for h in heads]
+
+def _measure(payload: Dict[str, Any]) -> Payload:
+    payload = compact(payload)
+    return payload, count_tokens(dumps(payload))
+
+def _trim_words(words: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # 予算超過時の決定的な切り詰め：contrast_pairs → 例示（collocations/frames）の順に落とす
+    out = []
+    for w in words:
+        senses = [{k: v for k, v in s.items() if k not in ("collocations", "frames")}
+                  for s in w.get("senses") or []]
+        out.append({"headword": w["headword"], "senses": senses})
+    return out
+
+def build_serve_payload(now: int, cfg: Dict[str, Any], cards: List[Dict[str, Any]],
+                        words_by_head: Dict[str, Dict[str, Any]],
+                        budget: Optional[int] = None) -> Payload:
+    budget = budget or int(cfg.get("payload_token_budget", DEFAULT_TOKEN_BUDGET))
+    base = {"now": now, "config": prompt_config(cfg)}
+    cards = [_card_view(c) for c in cards]
+    payload, n = _measure({**base, "words": _words_for(cards, words_by_head), "cards": cards})
+    if n <= budget:
+        return payload, n
+    words = _trim_words(_words_for(cards, words_by_head))
+    # それでも超える場合は末尾のカードから落とす（落ちたカードはローカル文面のまま出題）
+    keep = list(cards)
+    while True:
+        payload, n = _measure({**base, "words": [w for w in words if w["headword"] in {c["word"] for c in keep}],
+                               "cards": keep})
+        if n <= budget or len(keep) <= 1:
+            return payload, n
+        keep = keep[:-1]
+
+def build_grade_payloads(now: int, cfg: Dict[str, Any], answers: List[Dict[str, Any]],
+                         card_map: Dict[str, Dict[str, Any]], words_by_head: Dict[str, Dict[str, Any]],
+                         budget: Optional[int] = None, max_answers: Optional[int] = None) -> List[Payload]:
+    # 解答で参照されるカードと見出し語だけを載せ、予算（または件数上限）を超えたら解答順のまま分割する
+    budget = budget or int(cfg.get("payload_token_budget", DEFAULT_TOKEN_BUDGET))
+    base = {"now": now, "config": prompt_config(cfg)}
+
+    def build(chunk: List[Dict[str, Any]], trim: bool = False) -> Payload:
+        cards = [_card_view(card_map[a["card_id"]]) for a in chunk if a.get("card_id") in card_map]
+        words = _words_for(cards, words_by_head)
+        return _measure({**base, "words": _trim_words(words) if trim else words,
+                         "cards": cards, "user_answers": chunk})
+
+    out: List[Payload] = []
+    chunk: List[Dict[str, Any]] = []
+    for a in answers:
+        if chunk and ((max_answers and len(chunk) >= max_answers) or build(chunk + [a])[1] > budget):
+            out.append(build(chunk))
+            chunk = []
+        chunk.append(a)
+    if chunk:
+        out.append(build(chunk))
+    # 1件だけで予算を超えるものは語彙メタを切り詰める
+    return [build(p["user_answers"], trim=True) if n > budget else (p, n) for p, n in out]
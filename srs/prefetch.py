@@ -0,0 +1,82 @@
+# srs/prefetch.py
+# 次のセッションの先読み：解答中・採点直後にバックグラウンドで serve（LLM 言い換え込み）を済ませておく
+# 先読みに含まれるカードが更新されたら、その結果は捨てる（Deck の変更通知で判定）
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from srs.metrics import METRICS
+
+
+class _Ready(NamedTuple):
+    key: str
+    items: List[Dict[str, Any]]
+    ids: Set[str]
+
+
+class Prefetcher:
+    def __init__(self, deck):
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="srs-prefetch")
+        self._ready: Optional[_Ready] = None
+        self._running = False
+        self._dirty: Optional[Set[str]] = set()   # 計算中に変わった card_id（None = 全体）
+        deck.subscribe(self._on_change)
+
+    def _on_change(self, ids: Optional[Set[str]]):
+        with self._lock:
+            if self._running and self._dirty is not None:
+                if ids is None:
+                    self._dirty = None
+                else:
+                    self._dirty |= ids
+            r = self._ready
+            if r is not None and (ids is None or r.ids & ids):
+                self._ready = None
+                METRICS.incr("prefetch.invalidated")
+
+    def schedule(self, key: str, compute: Callable[[], List[Dict[str, Any]]]) -> bool:
+        # key は設定の指紋。同じ key の結果が既にある/計算中なら何もしない
+        with self._lock:
+            if self._running or (self._ready is not None and self._ready.key == key):
+                return False
+            self._running = True
+            self._dirty = set()
+        self._pool.submit(self._run, key, compute)
+        return True
+
+    def _run(self, key: str, compute: Callable[[], List[Dict[str, Any]]]):
+        items = None
+        try:
+            with METRICS.span("prefetch.serve"):
+                items = compute()
+        except Exception:
+            METRICS.incr("prefetch.error")
+        with self._lock:
+            dirty, self._running = self._dirty, False
+            if not items:
+                return
+            ids = {it["card_id"] for it in items}
+            if dirty is None or ids & dirty:
+                METRICS.incr("prefetch.invalidated")
+                return
+            self._ready = _Ready(key, items, ids)
+
+    def take(self, key: str, expect: Optional[Iterable[str]] = None) -> Optional[List[Dict[str, Any]]]:
+        # 使えるのは1回だけ（同じデッキを開いている別セッションに同じ出題を渡さない）
+        # expect: いまの now で選び直した card_id。先読み時の now と選定結果が違えば（時間が経って
+        # due になったカードがある等）古い出題なので捨てる
+        with self._lock:
+            r = self._ready
+            if r is None or r.key != key:
+                return None
+            self._ready = None
+        if expect is not None and set(expect) != r.ids:
+            METRICS.incr("prefetch.stale")
+            return None
+        METRICS.incr("prefetch.hit")
+        return r.items
+
+    def status(self) -> str:
+        with self._lock:
+            return "running" if self._running else ("ready" if self._ready is not None else "idle")
@@ -0,0 +1,109 @@
+# srs/schedule.py
+# 次回スケジューリング（Leitner / SM-2）をアプリ内で決める。LLM には採点ラベル（correct/hard/wrong）だけを出させる
+# 1枚ずつの next_review と、設定変更・インポート後に全カードの due を一度に付け直す列指向の reschedule
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DAY_MS = 24 * 3600 * 1000
+HOUR_MS = 3600 * 1000
+
+ALGOS = ["leitner", "sm2"]
+DEFAULT_OFFSETS = [1, 3, 7, 14, 30]
+# SCHEDULE（what-if の比較基準・エクスポートのヘッダ）に持つ設定キー
+SCHEDULE_KEYS = ("algo", "leitner_offsets_days", "wrong_delay_hours", "hard_delay_hours")
+
+# SM-2：採点ラベル → 想起の質 q（0..5）。q < 3 は失敗として反復回数を 0 に戻す
+QUALITY = {"correct": 5, "hard": 3, "wrong": 1}
+SM2_EF = 2.5
+SM2_MIN_EF = 1.3
+
+
+def schedule_config(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: cfg[k] for k in SCHEDULE_KEYS if k in cfg}
+
+def _offsets(cfg: Dict[str, Any]) -> List[float]:
+    return cfg.get("leitner_offsets_days") or DEFAULT_OFFSETS
+
+
+# ==============================
+# 1枚ずつ（採点直後）
+# ==============================
+def leitner_next(card: Dict[str, Any], result: str, now: int, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    offsets = _offsets(cfg)
+    stage = int(card.get("stage") or 1)
+    if result == "correct":
+        stage = min(len(offsets), stage + 1)
+        due = now + int(offsets[stage - 1] * DAY_MS)
+    elif result == "hard":
+        due = now + int(cfg.get("hard_delay_hours", 24) * HOUR_MS)
+    else:
+        stage = max(1, stage - 1)
+        due = now + int(cfg.get("wrong_delay_hours", 12) * HOUR_MS)
+    return {"stage": stage, "due_at": due}
+
+def sm2_state(card: Dict[str, Any], cfg: Dict[str, Any]) -> Dict[str, Any]:
+    # カードの SM-2 状態。まだ無ければ Leitner の段階から起こす（stage n = n-1 回成功・その段の間隔）
+    s = card.get("sm2")
+    if isinstance(s, dict):
+        return {"ef": float(s.get("ef", SM2_EF)), "interval_d": float(s.get("interval_d", 0)),
+                "reps": int(s.get("reps", 0))}
+    offsets = _offsets(cfg)
+    stage = min(max(1, int(card.get("stage") or 1)), len(offsets))
+    return {"ef": SM2_EF, "interval_d": float(offsets[stage - 1]) if stage > 1 else 0.0, "reps": stage - 1}
+
+def sm2_next(card: Dict[str, Any], result: str, now: int, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    s = sm2_state(card, cfg)
+    q = QUALITY.get(result, 0)
+    stage = int(card.get("stage") or 1)
+    if q < 3:
+        # 失敗：最初から覚え直し。次回は誤答の遅延後（Leitner と同じ）
+        reps, interval = 0, 0.0
+        stage = max(1, stage - 1)
+        due = now + int(cfg.get("wrong_delay_hours", 12) * HOUR_MS)
+    else:
+        reps = s["reps"] + 1
+        interval = 1.0 if reps == 1 else 6.0 if reps == 2 else round(s["interval_d"] * s["ef"], 2)
+        if result == "correct":
+            stage = min(len(_offsets(cfg)), stage + 1)
+        due = now + int(interval * DAY_MS)
+    ef = max(SM2_MIN_EF, s["ef"] + 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+    return {"stage": stage, "due_at": due, "sm2": {"ef": round(ef, 3), "interval_d": interval, "reps": reps}}
+
+def next_review(card: Dict[str, Any], result: str, now: int, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    # {"stage", "due_at"}（SM-2 なら "sm2" 状態も）。同じ入力なら常に同じ結果
+    if cfg.get("algo") == "sm2":
+        return sm2_next(card, result, now, cfg)
+    return leitner_next(card, result, now, cfg)
+
+
+# ==============================
+# 一括（analytics.DeckColumns の列に対して）
+# ==============================
+def intervals(cols, cfg: Dict[str, Any]) -> np.ndarray:
+    # 最後の結果と現在の段階（SM-2 は保存した間隔）から、その設定で付くはずだった間隔（ms）を引く。未回答は 0
+    offsets = np.asarray(_offsets(cfg), dtype=np.float64) * DAY_MS
+    stage = np.clip(cols.stage, 1, len(offsets)) - 1
+    rc = cols.result_code
+    out = np.zeros(len(cols), dtype=np.int64)
+    if cfg.get("algo") == "sm2":
+        # 状態の無いカードは sm2_state と同じく段階の間隔から起こす（stage 1 は 0 日）
+        base = np.where(stage > 0, offsets[stage], 0)
+        iv = np.where(cols.sm2_interval >= 0, cols.sm2_interval.astype(np.float64) * DAY_MS, base)
+        ok = (rc == 0) | (rc == 1)
+        out[ok] = iv[ok].astype(np.int64)
+    else:
+        out[rc == 0] = offsets[stage[rc == 0]].astype(np.int64)
+        out[rc == 1] = int(cfg.get("hard_delay_hours", 24) * HOUR_MS)
+    out[rc == 2] = int(cfg.get("wrong_delay_hours", 12) * HOUR_MS)
+    return out
+
+def reschedule(cols, old_cfg: Dict[str, Any], new_cfg: Dict[str, Any],
+               mask: Optional[np.ndarray] = None) -> np.ndarray:
+    # 最終回答時刻 = due_at - 旧間隔 とみなし、新しい間隔で due_at を付け直す（mask の行だけ。他はそのまま）
+    new_due = cols.due_at - intervals(cols, old_cfg) + intervals(cols, new_cfg)
+    return new_due if mask is None else np.where(mask, new_due, cols.due_at)
+
+def changed_cards(cols, new_due: np.ndarray) -> Dict[str, int]:
+    idx = np.nonzero(new_due != cols.due_at)[0]
+    return {cols.ids[i]: int(new_due[i]) for i in idx}
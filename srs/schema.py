@@ -0,0 +1,128 @@
+# srs/schema.py
+# LLM 応答の修復と検証：コードフェンス・前後の余計な文・末尾カンマを直してから読み、スキーマに合う要素だけを残す
+# 合わなかった（欠けた）card_id を返すので、その分だけを再送できる
+import json
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+RESULTS = {"correct", "hard", "wrong"}
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+
+
+def mode_of(payload: Dict[str, Any]) -> str:
+    return "grade" if "user_answers" in payload else "serve"
+
+def empty(mode: str, now: int) -> Dict[str, Any]:
+    # 呼び出し種別に合った空の応答（grade に serve の形を返さない）
+    if mode == "grade":
+        return {"mode": "grade", "results": []}
+    return {"mode": "serve", "session": {"served_at": now, "items": []}}
+
+
+# ==============================
+# 修復
+# ==============================
+def _outer_object(txt: str) -> Optional[str]:
+    # 最初の { から、文字列を考慮して対応する } までを切り出す（前置き・後書きの文を捨てる）
+    start = txt.find("{")
+    if start < 0:
+        return None
+    depth, in_str, esc = 0, False, False
+    for i in range(start, len(txt)):
+        ch = txt[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return txt[start:i + 1]
+    return None
+
+def parse(txt: str) -> Tuple[Optional[Any], bool]:
+    # (読めた値, 修復したか)。読めなければ (None, False)
+    try:
+        return json.loads(txt), False
+    except ValueError:
+        pass
+    s = _FENCE_RE.sub("", txt.strip())
+    s = _outer_object(s) or s
+    for cand in (s, _TRAILING_COMMA_RE.sub(r"\1", s)):
+        try:
+            return json.loads(cand), True
+        except ValueError:
+            continue
+    return None, False
+
+
+# ==============================
+# 検証
+# ==============================
+def asked_ids(payload: Dict[str, Any]) -> List[str]:
+    if mode_of(payload) == "grade":
+        return [a["card_id"] for a in payload.get("user_answers", [])]
+    return [c["id"] for c in payload.get("cards", [])]
+
+def _valid_item(it: Any, asked: Set[str]) -> bool:
+    return (isinstance(it, dict) and it.get("card_id") in asked
+            and isinstance(it.get("prompt"), str) and bool(it["prompt"].strip()))
+
+def _valid_result(r: Any, asked: Set[str]) -> bool:
+    # next は見ない（次回の段階・due はアプリ側の srs.schedule が result から決める）
+    if not (isinstance(r, dict) and r.get("card_id") in asked and r.get("result") in RESULTS):
+        return False
+    return isinstance(r.get("followups", []), list)
+
+def valid_item(it: Any, payload: Dict[str, Any]) -> bool:
+    return _valid_item(it, set(asked_ids(payload)))
+
+def validate(out: Any, payload: Dict[str, Any], now: int) -> Tuple[Dict[str, Any], List[str]]:
+    # (スキーマに合う要素だけの応答, 応答に無かった/不正だった card_id)
+    mode = mode_of(payload)
+    asked = asked_ids(payload)
+    asked_set = set(asked)
+    ok = empty(mode, now)
+    seen: Set[str] = set()
+    if isinstance(out, dict):
+        if mode == "grade":
+            for r in out.get("results") or []:
+                if _valid_result(r, asked_set) and r["card_id"] not in seen:
+                    seen.add(r["card_id"])
+                    ok["results"].append(r)
+        else:
+            session = out.get("session") if isinstance(out.get("session"), dict) else {}
+            ok["session"]["served_at"] = session.get("served_at", now)
+            for it in session.get("items") or []:
+                if _valid_item(it, asked_set) and it["card_id"] not in seen:
+                    seen.add(it["card_id"])
+                    ok["session"]["items"].append(it)
+    return ok, [i for i in asked if i not in seen]
+
+def merge(mode: str, a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    if mode == "grade":
+        a["results"] += b["results"]
+    else:
+        a["session"]["items"] += b["session"]["items"]
+    return a
+
+def subset(payload: Dict[str, Any], ids: List[str]) -> Dict[str, Any]:
+    # 指定した card_id の分だけに絞った入力（再送用）
+    keep = set(ids)
+    out = dict(payload)
+    if "user_answers" in payload:
+        out["user_answers"] = [a for a in payload["user_answers"] if a["card_id"] in keep]
+    out["cards"] = [c for c in payload.get("cards", []) if c["id"] in keep]
+    heads = {c.get("word") for c in out["cards"]}
+    if "words" in payload:
+        out["words"] = [w for w in payload["words"] if w.get("headword") in heads]
+    return out
@@ -0,0 +1,131 @@
+# srs/selection.py
+# serve のカード選定をローカルで行う（SRS_SYSTEM_PROMPT【カード選定】の実装）
+import random
+from typing import Dict, Any, List, Optional
+
+CARD_TYPES = ["ja2en", "en2ja", "cloze", "contrast", "compose"]
+_TYPE_ORDER = {t: i for i, t in enumerate(CARD_TYPES)}
+
+# Stage別の出題比率（プロンプト【カード選定】3)）
+STAGE_TYPE_WEIGHTS = {
+    1: {"ja2en": 2, "en2ja": 1, "cloze": 2},
+    2: {"ja2en": 1, "en2ja": 2, "cloze": 2},
+    3: {"contrast": 1, "cloze": 1},
+    4: {"compose": 1, "cloze": 1},
+    5: {"ja2en": 1, "en2ja": 1, "cloze": 1, "contrast": 1, "compose": 1},
+}
+MIN_CONTRAST = 2
+
+
+# ==============================
+# 選定
+# ==============================
+def _sense_id(card: Dict[str, Any]) -> Optional[str]:
+    return (card.get("tags") or {}).get("sense_id")
+
+def _type_weights(pool: List[Dict[str, Any]], cfg: Dict[str, Any]) -> Dict[str, float]:
+    # due カードの Stage 分布から目標比率を出し、min_mix_ratio を下限にする
+    profile: Dict[str, float] = {}
+    for c in pool:
+        w = STAGE_TYPE_WEIGHTS.get(int(c.get("stage") or 1), STAGE_TYPE_WEIGHTS[5])
+        total = sum(w.values())
+        for t, v in w.items():
+            profile[t] = profile.get(t, 0.0) + v / total
+    n = max(1, len(pool))
+    mix = cfg.get("min_mix_ratio") or {}
+    present = {c.get("type", "en2ja") for c in pool}
+    weights = {t: max(profile.get(t, 0.0) / n, float(mix.get(t, 0.0))) for t in present}
+    total = sum(weights.values()) or 1.0
+    return {t: v / total for t, v in weights.items()}
+
+def _spread(cards: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # 同一語（＝別義含む）→ 同一 sense_id の順で連続を避ける
+    out: List[Dict[str, Any]] = []
+    rest = list(cards)
+    while rest:
+        if not out:
+            out.append(rest.pop(0))
+            continue
+        prev = out[-1]
+        i = next((i for i, c in enumerate(rest) if c.get("word") != prev.get("word")), None)
+        if i is None:
+            i = next((i for i, c in enumerate(rest)
+                      if _sense_id(c) is None or _sense_id(c) != _sense_id(prev)), 0)
+        out.append(rest.pop(i))
+    return out
+
+def select_cards(due: List[Dict[str, Any]], cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    n = min(int(cfg.get("session_max", 20)), len(due))
+    if n <= 0:
+        return []
+    rng = random.Random(cfg.get("random_seed", 42))
+    pool = sorted(due, key=lambda c: (int(c.get("due_at") or 0), c["id"]))
+    rng.shuffle(pool)
+
+    # タイプ別のキュー（末尾から pop するので逆順に積む）
+    by_type: Dict[str, List[Dict[str, Any]]] = {}
+    for c in reversed(pool):
+        by_type.setdefault(c.get("type", "en2ja"), []).append(c)
+    weights = _type_weights(pool, cfg)
+    counts = {t: 0 for t in by_type}
+    picked: List[Dict[str, Any]] = []
+
+    # contrast は最低2問（可能なら）
+    for _ in range(min(MIN_CONTRAST, len(by_type.get("contrast", [])), n)):
+        picked.append(by_type["contrast"].pop())
+        counts["contrast"] += 1
+
+    # 不足タイプを優先補充（目標との差が最大のタイプから取る）
+    while len(picked) < n:
+        k = len(picked) + 1
+        avail = [t for t, q in by_type.items() if q]
+        t = max(avail, key=lambda t: (weights.get(t, 0.0) * k - counts[t],
+                                      -_TYPE_ORDER.get(t, len(CARD_TYPES)), t))
+        picked.append(by_type[t].pop())
+        counts[t] += 1
+    return _spread(picked)
+
+
+# ==============================
+# 出題アイテム化（serve 出力スキーマの items）
+# ==============================
+def _signals(word: Dict[str, Any], sense_id: Optional[str]) -> List[str]:
+    out: List[str] = []
+    for s in word.get("senses") or []:
+        if sense_id and s.get("sense_id") != sense_id:
+            continue
+        out += list(s.get("frames") or []) + list(s.get("collocations") or [])
+    return list(dict.fromkeys(out))
+
+def build_items(cards: List[Dict[str, Any]], words_by_head: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    items = []
+    for c in cards:
+        sid = _sense_id(c)
+        items.append({
+            "card_id": c["id"],
+            "stage": c.get("stage", 1),
+            "type": c.get("type", "en2ja"),
+            "prompt": c.get("prompt", ""),
+            "options": None,
+            "meta": {
+                "word": c.get("word"),
+                "sense_id": sid,
+                "signals": _signals(words_by_head.get(c.get("word")) or {}, sid),
+            },
+        })
+    return items
+
+def merge_phrased(items: List[Dict[str, Any]], phrased: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # LLM が言い換えた文面を card_id で差し込む（順序・card_id はローカル選定を正とする）
+    by_id = {p.get("card_id"): p for p in phrased if isinstance(p, dict)}
+    out = []
+    for it in items:
+        p = by_id.get(it["card_id"])
+        if p:
+            it = dict(it)
+            it["prompt"] = p.get("prompt") or it["prompt"]
+            it["options"] = p.get("options", it["options"])
+            signals = (p.get("meta") or {}).get("signals")
+            it["meta"] = {**it["meta"], "signals": signals or it["meta"]["signals"]}
+        out.append(it)
+    return out
@@ -0,0 +1,321 @@
+# srs/service.py
+# serve / grade / 取り込み / 保存 の本体（Streamlit 非依存。UI からはストア経由で呼ぶ）
+import threading
+from typing import Dict, Any, Iterable, Iterator, List, Callable, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from srs.store import CardStore
+from srs.model import Deck, as_dict
+from srs.analytics import DeckColumns
+from srs.cache import ResponseCache
+from srs.selection import select_cards, build_items, merge_phrased
+from srs.grading import known_forms, normalize, split_answers
+from srs import followups, schedule
+from srs.followups import FOLLOWUP_DELAY_MS, FOLLOWUP_PREFIX, FollowupIndex
+from srs.payload import build_serve_payload, build_grade_payloads
+from srs.concurrency import RateLimiter, map_bounded
+from srs.imageprep import prepare, hamming
+from srs.extract import extract_headwords
+from srs.enrich import DEFAULT_BATCH_SIZE, EnrichLLM, enrich_headwords
+from srs.metrics import METRICS
+
+# llm(payload) -> 出力JSON（SRS_SYSTEM_PROMPT は呼び出し側で束縛する）
+LLM = Callable[[Dict[str, Any]], Dict[str, Any]]
+# llm_stream(payload) -> session.items[] を完成順に返すイテレータ
+LLMStream = Callable[[Dict[str, Any]], Iterator[Dict[str, Any]]]
+# ocr(画像bytes, mime) -> テキスト
+OCR = Callable[[bytes, str], str]
+# ストアそのもの、またはその上の索引つきデッキ（同じ呼び方で使える）
+Store = Union[CardStore, Deck]
+
+
+
+# ==============================
+# 取り込み（OCRテキスト→語群→カード雛形）
+# ==============================
+def bootstrap(store: Store, text: str, now: int) -> int:
+    return len(bootstrap_words(store, text, now))
+
+def bootstrap_words(store: Store, text: str, now: int) -> List[str]:
+    # 追加した見出し語を返す（語彙補完の対象）
+    # 既にデッキにある見出し語は追加しない（同じページを何度取り込んでも増えない）
+    words = store.new_headwords(extract_headwords(text))
+    if not words:
+        return []
+    with store.batch():
+        store.add_words([{"headword": w, "senses": [], "contrast_pairs": []} for w in words])
+        store.put_cards([{
+            "id": store.new_id("c"),
+            "word": w,
+            "stage": 1,
+            "type": "en2ja",
+            "prompt": f"【和訳】{w}",
+            "answer": "",
+            "tags": {"sense_id": None},
+            "due_at": now,
+            "last_result": None
+        } for w in words])
+    return words
+
+
+# ==============================
+# 複数ページの一括取り込み（前処理＋OCR を並列、終わったページから順にカード化）
+# ==============================
+# dHash 256bit 中の許容ビット差。同じ写真の再アップロード/再圧縮/縮小は 0〜数ビットに収まる
+# レイアウトの似た別ページを誤って捨てないよう小さめにし、撮り直しは見出し語側の重複排除に任せる
+PAGE_DUP_DISTANCE = 4
+
+def import_pages(store: Store, pages: List[bytes], ocr: OCR, now: int, cfg: Dict[str, Any],
+                 on_page: Optional[Callable[[int, str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    # on_page(ページ番号, "imported"|"duplicate"|"error", 詳細) はメインスレッドで呼ばれる
+    lock = threading.Lock()
+    seen = store.page_hashes()
+
+    def claim(h: str) -> bool:
+        # 取り込み済み・同じバッチ内の先行ページと近ければ重複扱い
+        with lock:
+            if any(hamming(h, s) <= PAGE_DUP_DISTANCE for s in seen):
+                return False
+            seen.append(h)
+            return True
+
+    def work(i: int):
+        prep = prepare(pages[i])
+        if not claim(prep.phash):
+            return {"status": "duplicate", "phash": prep.phash}
+        return {"status": "imported", "phash": prep.phash, "text": ocr(prep.data, prep.mime),
+                "saved_bytes": prep.stats["saved_bytes"]}
+
+    summary: Dict[str, Any] = {"imported": 0, "duplicate": 0, "error": 0, "words": 0, "headwords": []}
+    for i, out in map_bounded(work, range(len(pages)), max_workers=int(cfg.get("ocr_max_concurrency", 4)),
+                              limiter=RateLimiter(float(cfg.get("llm_rate_per_s", 2.0)),
+                                                  burst=int(cfg.get("ocr_max_concurrency", 4)))):
+        if isinstance(out, Exception):
+            out = {"status": "error", "error": str(out)}
+        elif out["status"] == "imported":
+            added = bootstrap_words(store, out["text"], now)
+            store.add_page(out["phash"], now)
+            out["words"] = len(added)
+            summary["words"] += len(added)
+            summary["headwords"] += added
+        summary[out["status"]] += 1
+        if on_page:
+            on_page(i, out["status"], out)
+    return summary
+
+
+# ==============================
+# 語彙の補完（新しい見出し語に語義・対比ペアを埋め、和訳カードの答えと語義を決める）
+# ==============================
+def apply_enrichment(store: Store, enriched: Dict[str, Dict[str, Any]]) -> int:
+    # 答えが空の雛形カードだけを埋める（学習者が直したカードは上書きしない）
+    cards = []
+    for h, w in enriched.items():
+        top = w["senses"][0]
+        for c in store.cards_by_word(h):
+            if c["type"] == "en2ja" and not c["answer"]:
+                cards.append({**as_dict(c), "answer": top["core_jp"],
+                              "tags": {**(c["tags"] or {}), "sense_id": top["sense_id"]}})
+    with store.batch():
+        store.put_words(list(enriched.values()))
+        store.put_cards(cards)
+    return len(cards)
+
+def enrich(store: Store, cfg: Dict[str, Any], headwords: List[str], call: EnrichLLM,
+           cache: Optional[ResponseCache] = None, tag: str = "",
+           on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    # 語義がまだ無い語だけを対象にする（取り込み直後に別セッションが補完済みのこともある）
+    words = store.get_words(headwords)
+    todo = [h for h in headwords if h in words and not words[h]["senses"]]
+    if not todo:
+        return {"words": 0, "cards": 0, "missing": 0}
+    limiter = RateLimiter(float(cfg.get("llm_rate_per_s", 2.0)), burst=int(cfg.get("llm_max_concurrency", 4)))
+    with METRICS.span("enrich", words=len(todo)):
+        enriched = enrich_headwords(todo, call, cache=cache, tag=tag,
+                                    batch_size=int(cfg.get("enrich_batch_size", DEFAULT_BATCH_SIZE)),
+                                    max_workers=int(cfg.get("llm_max_concurrency", 4)), limiter=limiter,
+                                    on_progress=on_progress)
+        cards = apply_enrichment(store, enriched) if enriched else 0
+    return {"words": len(enriched), "cards": cards, "missing": len(todo) - len(enriched)}
+
+
+# ==============================
+# serve
+# ==============================
+def _bodies(store: Store, heads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # 選定は due_heads（索引の列だけ）で行い、本体は選ばれたカードの分だけ読む
+    cards = store.get_cards(c["id"] for c in heads)
+    return [cards[c["id"]] for c in heads if c["id"] in cards]
+
+def select_ids(store: Store, cfg: Dict[str, Any], now: int) -> List[str]:
+    # serve と同じ選定だけを行う（索引の列のみ・LLM なし）。先読みが今も有効かの確認用
+    return [c["id"] for c in select_cards(store.due_heads(now), cfg)]
+
+def serve(store: Store, cfg: Dict[str, Any], now: int, llm: LLM,
+          exclude: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    # 選定（due/上限/シャッフル/比率/sense分散）はローカルで決定的に行う
+    # exclude: 出題中のカード（解答中に次のセッションを先読みするときに除く）
+    with METRICS.span("serve.select"):
+        due = store.due_heads(now)
+        if exclude:
+            due = [c for c in due if c["id"] not in exclude]
+        picked = _bodies(store, select_cards(due, cfg))
+        words_by_head = store.get_words(c["word"] for c in picked)
+        items = build_items(picked, words_by_head)
+    # LLM には選ばれたカードの文面づくりだけを頼む（任意）
+    if items and cfg.get("serve_llm_phrasing"):
+        with METRICS.span("payload.serve"):
+            payload, _ = build_serve_payload(now, cfg, picked, words_by_head)
+        out = llm(payload)
+        items = merge_phrased(items, out.get("session", {}).get("items", []))
+    return items
+
+
+def serve_stream(store: Store, cfg: Dict[str, Any], now: int, llm_stream: LLMStream) -> Iterator[Dict[str, Any]]:
+    # LLM 文面づくりをストリーミングし、言い換え済みの item から順に返す
+    # 言い換えが返らなかったカードは最後にローカル文面のまま返す
+    with METRICS.span("serve.select"):
+        picked = _bodies(store, select_cards(store.due_heads(now), cfg))
+        words_by_head = store.get_words(c["word"] for c in picked)
+        items = build_items(picked, words_by_head)
+    if not items:
+        return
+    local = {it["card_id"]: it for it in items}
+    with METRICS.span("payload.serve"):
+        payload, _ = build_serve_payload(now, cfg, picked, words_by_head)
+    try:
+        for p in llm_stream(payload):
+            it = local.pop(p.get("card_id"), None)
+            if it is not None:
+                yield merge_phrased([it], [p])[0]
+    except Exception:
+        pass  # 途中で失敗しても残りはローカル文面で出題する
+    yield from local.values()
+
+
+# ==============================
+# grade
+# ==============================
+def apply_results(store: Store, card_map: Dict[str, Dict[str, Any]],
+                  results: List[Dict[str, Any]], now: int, cfg: Dict[str, Any]) -> int:
+    # 次回の段階・due は result からローカルで決める（LLM の next は使わない）
+    # フォローアップは指紋で重複をまとめ、語・語義ごとの上限を守る。身についたフォローアップは引退（削除）
+    # 採点1回ごとの結果はジャーナルに review として残す（カードの状態は上書きでも履歴は消えない）
+    # card_map のカードは作業セット（全セッション共有）の本体なので、写しを更新して put_cards で差し替える
+    work = {r["card_id"]: dict(as_dict(card_map[r["card_id"]])) for r in results if r.get("card_id") in card_map}
+    words = {c["word"] for c in work.values()}
+    index = FollowupIndex((work.get(c["id"], c) for w in words for c in store.cards_by_word(w)), cfg)
+    changed: Dict[str, Dict[str, Any]] = {}
+    retired: List[str] = []
+    reviews: List[Dict[str, Any]] = []
+    for r in results:
+        card = work.get(r.get("card_id"))
+        if card is None:
+            continue
+        nxt = r["next"] = schedule.next_review(card, r["result"], now, cfg)
+        reviews.append({"card_id": card["id"], "at": now, "result": r["result"], "score": r.get("score"),
+                        "stage": nxt["stage"], "due_at": nxt["due_at"],
+                        "latency_ms": (r.get("log") or {}).get("latency_ms")})
+        card["stage"] = nxt["stage"]
+        card["due_at"] = nxt["due_at"]
+        if "sm2" in nxt:
+            card["sm2"] = nxt["sm2"]
+        card["last_result"] = r.get("result", card.get("last_result"))
+        if followups.mastered(card, cfg):
+            index.remove(card)
+            retired.append(card["id"])
+            changed.pop(card["id"], None)
+        else:
+            changed[card["id"]] = card
+        # フォローアップをカード化（同じ内容が既にあれば既存を前倒しするだけ）
+        for f in r.get("followups", []):
+            status, fu = index.offer({
+                "word": card["word"],
+                "stage": max(1, card["stage"] - 1),
+                "type": f.get("type", "cloze"),
+                "prompt": f.get("prompt", ""),
+                "answer": f.get("answer", ""),
+                "tags": f.get("tags", {}),
+                "due_at": now + FOLLOWUP_DELAY_MS,
+                "last_result": None
+            }, now)
+            METRICS.incr(f"followup.{status}")
+            if status == "new":
+                fu["id"] = store.new_id(FOLLOWUP_PREFIX)
+            elif status == "merged" and fu["id"] in work:
+                work[fu["id"]] = fu   # このあと同じカードを採点するときは前倒し済みの写しを使う
+            if fu is not None and fu["id"] not in retired:
+                changed[fu["id"]] = fu
+    with store.batch():
+        store.put_cards(changed.values())
+        store.log_reviews(reviews)
+        if retired:
+            store.delete_cards(retired)
+            METRICS.incr("followup.retired", n=len(retired))
+    return len(changed)
+
+def compact_followups(store: Store, cfg: Dict[str, Any]) -> Dict[str, int]:
+    # 既存デッキのフォローアップを整理する（重複の統合・上限超過と身についたものの削除）
+    with METRICS.span("followup.compact"):
+        changed, drop = followups.compact(store.iter_cards(), cfg)
+        with store.batch():
+            store.put_cards(changed)
+            store.delete_cards(drop)
+    return {"updated": len(changed), "deleted": len(drop)}
+
+def grade(store: Store, cfg: Dict[str, Any], answers: List[Dict[str, Any]], now: int, llm: LLM,
+          on_progress: Optional[Callable[[int, int], None]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    # 戻り値は (採点結果, 採点できなかった解答)。失敗したチャンクの解答だけを再採点すればよい
+    card_map = store.get_cards(a.get("card_id") for a in answers)
+    words_by_head = store.get_words(c["word"] for c in card_map.values())
+    # 語形だけで決まる解答はローカル採点、残り（語義/文脈判断）だけ LLM へ
+    # 解答がデッキの見出し語・対比ペアの語そのものなら、綴り誤りではなく別の語として LLM に回す
+    typed = list({normalize(a.get("user_input", "")) for a in answers} - {""})
+    known = known_forms(words_by_head.values(), set(typed) - set(store.new_headwords(typed)))
+    with METRICS.span("grade.local", answers=len(answers)):
+        results, pending = split_answers(answers, card_map, now, cfg, known)
+        apply_results(store, card_map, results, now, cfg)
+    failed: List[Dict[str, Any]] = []
+    if not pending:
+        return results, failed
+
+    # 小さなチャンクに分けて並列採点し、完了したものから順にストアへ反映する
+    with METRICS.span("payload.grade", answers=len(pending)):
+        chunks = build_grade_payloads(now, cfg, pending, card_map, words_by_head,
+                                      max_answers=int(cfg.get("grade_chunk_size", 5)))
+    limiter = RateLimiter(float(cfg.get("llm_rate_per_s", 2.0)), burst=int(cfg.get("llm_max_concurrency", 4)))
+    done = 0
+    for (payload, _), out in map_bounded(lambda p: llm(p[0]), chunks,
+                                         max_workers=int(cfg.get("llm_max_concurrency", 4)), limiter=limiter):
+        asked = {a["card_id"] for a in payload["user_answers"]}
+        got = [] if isinstance(out, Exception) else [r for r in out.get("results", []) if r.get("card_id") in asked]
+        apply_results(store, card_map, got, now, cfg)
+        results += got
+        graded = {r["card_id"] for r in got}
+        failed += [a for a in pending if a["card_id"] in asked - graded]
+        done += 1
+        if on_progress:
+            on_progress(done, len(chunks))
+    return results, failed
+
+
+
+# ==============================
+# 一括の再スケジュール（設定変更・インポート後）
+# ==============================
+def reschedule(store: Store, old_cfg: Dict[str, Any], new_cfg: Dict[str, Any],
+               ids: Optional[Iterable[str]] = None) -> int:
+    # old_cfg で付いた due を new_cfg で付け直す（ids を渡せばそのカードだけ）。列に対して1回で計算する
+    cols = store.columns() if isinstance(store, Deck) else DeckColumns(store.iter_cards())
+    mask = None
+    if ids is not None:
+        mask = np.zeros(len(cols), dtype=bool)
+        mask[[cols.pos[i] for i in ids if i in cols.pos]] = True
+    with METRICS.span("schedule.reschedule", cards=len(cols)):
+        changed = schedule.changed_cards(cols, schedule.reschedule(cols, old_cfg, new_cfg, mask))
+        if changed:
+            # 作業セットの本体は書き換えず、写しに新しい due を入れて差し替える
+            cards = store.get_cards(changed)
+            store.put_cards(dict(as_dict(c), due_at=changed[cid]) for cid, c in cards.items())
+    return len(changed)
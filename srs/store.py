@@ -0,0 +1,384 @@
+# srs/store.py
+# SQLite 版のカード/語彙ストア（st.session_state のリストを置換）
+# due_at / word / tags.sense_id / id に索引を張り、期限検索・更新を O(log n) にする
+# 変更はすべて追記専用のジャーナル（events）にも残す。状態と同じトランザクションで書くので追記のコストは行1つ分
+# WAL + synchronous=NORMAL なので fsync はコミットごとではなくチェックポイントでまとめて行われる
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Set
+
+from srs.extract import headword_key
+from srs.model import IdAllocator
+from srs.metrics import METRICS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS words (
+    deck     TEXT NOT NULL,
+    headword TEXT NOT NULL,
+    data     TEXT NOT NULL,
+    PRIMARY KEY (deck, headword)
+);
+CREATE TABLE IF NOT EXISTS cards (
+    deck     TEXT NOT NULL,
+    id       TEXT NOT NULL,
+    word     TEXT,
+    sense_id TEXT,
+    due_at   INTEGER NOT NULL DEFAULT 0,
+    data     TEXT NOT NULL,
+    PRIMARY KEY (deck, id)
+);
+CREATE INDEX IF NOT EXISTS idx_cards_due   ON cards (deck, due_at);
+CREATE INDEX IF NOT EXISTS idx_cards_word  ON cards (deck, word);
+CREATE INDEX IF NOT EXISTS idx_cards_sense ON cards (deck, sense_id);
+CREATE TABLE IF NOT EXISTS pages (
+    deck        TEXT NOT NULL,
+    phash       TEXT NOT NULL,
+    imported_at INTEGER NOT NULL,
+    PRIMARY KEY (deck, phash)
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+    deck  TEXT NOT NULL,
+    at    INTEGER NOT NULL,
+    kind  TEXT NOT NULL,
+    key   TEXT,
+    data  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_deck ON events (deck, seq);
+CREATE TABLE IF NOT EXISTS snapshots (
+    deck      TEXT NOT NULL,
+    seq       INTEGER NOT NULL,
+    taken_at  INTEGER NOT NULL,
+    data      BLOB NOT NULL,
+    PRIMARY KEY (deck, seq)
+);
+CREATE TABLE IF NOT EXISTS seq (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# SQLite のバインド変数上限に余裕をもたせた IN 句の分割単位
+_IN_CHUNK = 500
+
+# ジャーナルの種類。card / word / delete は key（id / headword）だけを持ち、中身は表の現在の行から読む
+# review は採点1回分の履歴（data に結果と次回）
+STATE_KINDS = ("card", "word", "delete")
+_STATE_IN = ",".join(f"'{k}'" for k in STATE_KINDS)
+KEEP_SNAPSHOTS = 2   # 残すスナップショットの数。最も古いものより前の状態イベントは詰める
+
+
+def _dumps(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def _card_row(deck: str, c: Dict[str, Any]):
+    sense_id = (c.get("tags") or {}).get("sense_id")
+    return (deck, c["id"], c.get("word"), sense_id, int(c.get("due_at") or 0), _dumps(c))
+
+
+class CardStore:
+    def __init__(self, path: str, deck: str = "default"):
+        self.path = path
+        self.deck = deck
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._depth = 0
+        self._heads: Optional[Set[str]] = None   # 見出し語索引（headword_key の集合）
+        self._ids = IdAllocator(self.reserve_ids)
+
+    # ---------- トランザクション ----------
+    @contextmanager
+    def batch(self):
+        # ネスト可能。最外側でまとめて COMMIT する
+        with self._lock:
+            if self._depth == 0:
+                self._db.execute("BEGIN")
+            self._depth += 1
+            try:
+                yield self
+            except Exception:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._db.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._db.execute("COMMIT")
+
+    def _query(self, sql: str, args=()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _in_query(self, sql: str, keys: List[str]) -> List[tuple]:
+        # sql は "... IN ({})" を含むこと
+        rows: List[tuple] = []
+        for i in range(0, len(keys), _IN_CHUNK):
+            part = keys[i:i + _IN_CHUNK]
+            rows += self._query(sql.format(",".join("?" * len(part))), [self.deck, *part])
+        return rows
+
+    # ---------- ジャーナル ----------
+    def _append(self, kind: str, keys: Iterable[Optional[str]], data: Optional[Iterable[Optional[str]]] = None):
+        # 呼び出し側の batch() の中で状態の書き込みと一緒にコミットされる
+        at = int(time.time() * 1000)
+        keys = list(keys)
+        vals = list(data) if data is not None else [None] * len(keys)
+        self._db.executemany("INSERT INTO events (deck, at, kind, key, data) VALUES (?,?,?,?,?)",
+                             [(self.deck, at, kind, k, v) for k, v in zip(keys, vals)])
+        METRICS.incr("journal.append", n=len(keys), kind=kind)
+
+    def log_reviews(self, reviews: Iterable[Dict[str, Any]]):
+        # 採点の履歴（{"card_id","result","stage","due_at","at"}）。状態は put_cards の card イベントが持つ
+        reviews = list(reviews)
+        if reviews:
+            with self.batch():
+                self._append("review", [r["card_id"] for r in reviews], [_dumps(r) for r in reviews])
+
+    def last_seq(self) -> int:
+        # 詰めたあとはイベントが残っていないことがあるので、スナップショットの位置も見る（位置は戻らない）
+        rows = self._query("SELECT MAX(s) FROM (SELECT MAX(seq) AS s FROM events WHERE deck=? "
+                           "UNION ALL SELECT MAX(seq) FROM snapshots WHERE deck=?)", (self.deck, self.deck))
+        return rows[0][0] or 0
+
+    def events(self, since: int = 0, kinds: Optional[Iterable[str]] = None,
+               chunk: int = 1000) -> Iterator[Dict[str, Any]]:
+        # since より後のイベントを seq 順に（履歴の集計用）
+        kinds = list(kinds) if kinds is not None else None
+        last = since
+        while True:
+            sql = "SELECT seq, at, kind, key, data FROM events WHERE deck=? AND seq>?"
+            args: list = [self.deck, last]
+            if kinds:
+                sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+                args += kinds
+            rows = self._query(sql + " ORDER BY seq LIMIT ?", args + [chunk])
+            if not rows:
+                return
+            for seq, at, kind, key, data in rows:
+                yield {"seq": seq, "at": at, "kind": kind, "key": key,
+                       "data": json.loads(data) if data else None}
+            last = rows[-1][0]
+
+    def journal_floor(self) -> int:
+        # これより前の状態イベントは詰めてある（差分はこの seq 以降からしか作れない）
+        rows = self._query("SELECT MIN(seq) FROM snapshots WHERE deck=?", (self.deck,))
+        return rows[0][0] or 0
+
+    def changes_since(self, since: int) -> Optional[Dict[str, Any]]:
+        # since より後に変わったカード・語彙・削除（各 key の最後のイベントだけを見る）
+        # 詰めた範囲より前からなら None（全体を書き出すしかない）
+        with self._lock:
+            if since < self.journal_floor():
+                return None
+            upto = self.last_seq()
+            rows = self._db.execute(
+                "SELECT kind, key, MAX(seq) FROM events WHERE deck=? AND seq>? AND seq<=? "
+                f"AND kind IN ({_STATE_IN}) GROUP BY kind, key", (self.deck, since, upto)).fetchall()
+        latest: Dict[str, tuple] = {}
+        words: List[str] = []
+        for kind, key, seq in rows:
+            if kind == "word":
+                words.append(key)
+            elif key not in latest or seq > latest[key][1]:
+                latest[key] = (kind, seq)
+        return {"since": since, "upto": upto, "words": words,
+                "cards": [k for k, (kind, _) in latest.items() if kind == "card"],
+                "deleted": [k for k, (kind, _) in latest.items() if kind == "delete"]}
+
+    def save_snapshot(self, seq: int, data: bytes, now: int):
+        # seq 時点の状態（中身の形式は呼び出し側＝Deck が決める）を保存し、古いスナップショットより前の状態イベントを詰める
+        # review（採点履歴）は詰めずに残す
+        with METRICS.span("journal.snapshot", bytes=len(data)), self.batch():
+            self._db.execute("INSERT OR REPLACE INTO snapshots (deck, seq, taken_at, data) VALUES (?,?,?,?)",
+                             (self.deck, seq, now, sqlite3.Binary(data)))
+            keep = [r[0] for r in self._db.execute(
+                "SELECT seq FROM snapshots WHERE deck=? ORDER BY seq DESC LIMIT ?", (self.deck, KEEP_SNAPSHOTS))]
+            floor = min(keep)
+            self._db.execute("DELETE FROM snapshots WHERE deck=? AND seq<?", (self.deck, floor))
+            n = self._db.execute(f"DELETE FROM events WHERE deck=? AND seq<=? AND kind IN ({_STATE_IN})",
+                                 (self.deck, floor)).rowcount
+        METRICS.incr("journal.compacted", n=n)
+        self.sync()
+
+    def latest_snapshot(self) -> Optional[tuple]:
+        # (seq, data) または None
+        rows = self._query("SELECT seq, data FROM snapshots WHERE deck=? ORDER BY seq DESC LIMIT 1", (self.deck,))
+        return (rows[0][0], bytes(rows[0][1])) if rows else None
+
+    def journal_stats(self) -> Dict[str, Any]:
+        rows = self._query("SELECT kind, COUNT(*) FROM events WHERE deck=? GROUP BY kind", (self.deck,))
+        snap = self._query("SELECT seq, taken_at FROM snapshots WHERE deck=? ORDER BY seq DESC LIMIT 1", (self.deck,))
+        return {"seq": self.last_seq(), "events": dict(rows),
+                "snapshot_seq": snap[0][0] if snap else 0, "snapshot_at": snap[0][1] if snap else None}
+
+    def sync(self):
+        # WAL を本体へ書き戻す（ここでまとめて fsync される）。書き込み中の接続があれば届いた所まで
+        with self._lock:
+            if self.path != ":memory:" and self._depth == 0:
+                self._db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # ---------- ID 払い出し（同じミリ秒に複数作っても衝突しない） ----------
+    def reserve_ids(self, n: int) -> int:
+        # 連番を n 件まとめて予約し、その先頭を返す（UPDATE が先なので別接続と競合しても重ならない）
+        with self.batch():
+            self._db.execute("INSERT OR IGNORE INTO seq (name, value) VALUES ('card_id', 0)")
+            self._db.execute("UPDATE seq SET value = value + ? WHERE name='card_id'", (n,))
+            end = self._db.execute("SELECT value FROM seq WHERE name='card_id'").fetchone()[0]
+        return end - n + 1
+
+    def new_id(self, prefix: str) -> str:
+        return self._ids.next(prefix)
+
+    def ensure_ids_above(self, n: int):
+        # インポートした id（c_123 など）を以後の払い出しと重ねない。予約済みの残りは捨てて取り直す
+        with self.batch():
+            self._db.execute("INSERT OR IGNORE INTO seq (name, value) VALUES ('card_id', 0)")
+            self._db.execute("UPDATE seq SET value = MAX(value, ?) WHERE name='card_id'", (n,))
+            self._ids = IdAllocator(self.reserve_ids)
+
+    # ---------- 見出し語索引（初回に1度だけ読み込み、以後は挿入のたびに更新） ----------
+    def _headwords(self) -> Set[str]:
+        with self._lock:
+            if self._heads is None:
+                self._heads = {headword_key(h) for (h,) in
+                               self._db.execute("SELECT headword FROM words WHERE deck=?", (self.deck,))}
+            return self._heads
+
+    def new_headwords(self, headwords: Iterable[str]) -> List[str]:
+        # 既存デッキ・同じ入力内のどちらとも重ならない見出し語だけを返す（1語 O(1)）
+        with self._lock:
+            heads = self._headwords()
+            out, seen = [], set()
+            for h in headwords:
+                k = headword_key(h)
+                if k not in heads and k not in seen:
+                    seen.add(k)
+                    out.append(h)
+            return out
+
+    # ---------- 語彙 ----------
+    def add_words(self, words: Iterable[Dict[str, Any]]) -> int:
+        words = list(words)
+        with self.batch():
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO words (deck, headword, data) VALUES (?,?,?)",
+                [(self.deck, w["headword"], _dumps(w)) for w in words])
+            n = self._db.total_changes - before
+            if n:
+                self._append("word", [w["headword"] for w in words])
+            self._headwords().update(headword_key(w["headword"]) for w in words)
+            return n
+
+    def put_words(self, words: Iterable[Dict[str, Any]]):
+        words = list(words)
+        with METRICS.span("store.put_words"), self.batch():
+            self._db.executemany(
+                "INSERT OR REPLACE INTO words (deck, headword, data) VALUES (?,?,?)",
+                [(self.deck, w["headword"], _dumps(w)) for w in words])
+            self._append("word", [w["headword"] for w in words])
+            self._headwords().update(headword_key(w["headword"]) for w in words)
+
+    def get_words(self, headwords: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        rows = self._in_query("SELECT data FROM words WHERE deck=? AND headword IN ({})",
+                              list(dict.fromkeys(headwords)))
+        out = [json.loads(d) for (d,) in rows]
+        return {w["headword"]: w for w in out}
+
+    def iter_words(self, chunk: int = 1000) -> Iterator[Dict[str, Any]]:
+        last = ""
+        while True:
+            rows = self._query("SELECT headword, data FROM words WHERE deck=? AND headword>? "
+                               "ORDER BY headword LIMIT ?", (self.deck, last, chunk))
+            if not rows:
+                return
+            for _, d in rows:
+                yield json.loads(d)
+            last = rows[-1][0]
+
+    def count_words(self) -> int:
+        return self._query("SELECT COUNT(*) FROM words WHERE deck=?", (self.deck,))[0][0]
+
+    def sample_words(self, n: int) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT data FROM words WHERE deck=? ORDER BY rowid LIMIT ?", (self.deck, n))
+        return [json.loads(d) for (d,) in rows]
+
+    # ---------- カード ----------
+    def put_cards(self, cards: Iterable[Dict[str, Any]]):
+        rows = [_card_row(self.deck, c) for c in cards]
+        with METRICS.span("store.put_cards"), self.batch():
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cards (deck, id, word, sense_id, due_at, data) VALUES (?,?,?,?,?,?)", rows)
+            self._append("card", [r[1] for r in rows])
+
+    def put_card(self, card: Dict[str, Any]):
+        self.put_cards([card])
+
+    def delete_cards(self, ids: Iterable[str]):
+        ids = list(dict.fromkeys(ids))
+        with self.batch():
+            for i in range(0, len(ids), _IN_CHUNK):
+                part = ids[i:i + _IN_CHUNK]
+                self._db.execute(f"DELETE FROM cards WHERE deck=? AND id IN ({','.join('?' * len(part))})",
+                                 [self.deck, *part])
+            self._append("delete", ids)
+
+    def get_card(self, card_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT data FROM cards WHERE deck=? AND id=?", (self.deck, card_id))
+        return json.loads(rows[0][0]) if rows else None
+
+    def get_cards(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        rows = self._in_query("SELECT data FROM cards WHERE deck=? AND id IN ({})", list(dict.fromkeys(ids)))
+        out = [json.loads(d) for (d,) in rows]
+        return {c["id"]: c for c in out}
+
+    def due_cards(self, now: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        sql = "SELECT data FROM cards WHERE deck=? AND due_at<=? ORDER BY due_at, id"
+        args: list = [self.deck, now]
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return [json.loads(d) for (d,) in self._query(sql, args)]
+
+    def due_heads(self, now: int) -> List[Dict[str, Any]]:
+        # Deck.due_heads と同じ呼び方（こちらはカード本体をそのまま返す）
+        return self.due_cards(now)
+
+    def cards_by_word(self, word: str) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT data FROM cards WHERE deck=? AND word=?", (self.deck, word))
+        return [json.loads(d) for (d,) in rows]
+
+    def iter_cards(self, chunk: int = 1000) -> Iterator[Dict[str, Any]]:
+        last = ""
+        while True:
+            rows = self._query("SELECT id, data FROM cards WHERE deck=? AND id>? ORDER BY id LIMIT ?",
+                               (self.deck, last, chunk))
+            if not rows:
+                return
+            for _, d in rows:
+                yield json.loads(d)
+            last = rows[-1][0]
+
+    def count_cards(self) -> int:
+        return self._query("SELECT COUNT(*) FROM cards WHERE deck=?", (self.deck,))[0][0]
+
+    def sample_cards(self, n: int) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT data FROM cards WHERE deck=? ORDER BY rowid LIMIT ?", (self.deck, n))
+        return [json.loads(d) for (d,) in rows]
+
+    # ---------- 取り込み済みページ（知覚ハッシュ） ----------
+    def page_hashes(self) -> List[str]:
+        return [h for (h,) in self._query("SELECT phash FROM pages WHERE deck=?", (self.deck,))]
+
+    def add_page(self, phash: str, now: int):
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO pages (deck, phash, imported_at) VALUES (?,?,?)",
+                             (self.deck, phash, now))
@@ -0,0 +1,65 @@
+# srs/wire.py
+# LLM との間だけで使う短縮スキーマ（キーの短縮＋列挙値の番号化）。送る直前に encode、受け取った直後に decode する
+# 対応表は固定なので、凡例（LEGEND）を system に足しても毎回同じバイト列になる（プロンプトキャッシュが効く）
+from typing import Any, Dict, List
+
+KEYS: Dict[str, str] = {
+    # 入力
+    "now": "n", "config": "cf", "words": "W", "headword": "h", "senses": "S", "sense_id": "si",
+    "core_jp": "j", "frames": "fr", "collocations": "co", "register": "rg", "contrast_pairs": "cp",
+    "meaning_delta": "md", "collocation_delta": "cd", "register_delta": "rd",
+    "cards": "C", "id": "i", "word": "w", "stage": "st", "type": "t", "prompt": "p", "answer": "an",
+    "tags": "tg", "due_at": "d", "last_result": "lr",
+    "user_answers": "U", "card_id": "ci", "user_input": "ui", "latency_ms": "l",
+    # 出力
+    "mode": "m", "session": "se", "served_at": "sa", "items": "I", "options": "o", "meta": "mt",
+    "signals": "sg", "results": "R", "result": "r", "score": "sc", "rubric": "rb", "form": "f",
+    "sense": "sn", "context": "cx", "explanation": "ex", "next": "nx", "followups": "fu", "log": "lg",
+    "reason": "rs",
+}
+_LONG = {v: k for k, v in KEYS.items()}
+
+# 列挙値は 0 始まりの番号で送る（キーは元の名前で引く）
+ENUMS: Dict[str, List[str]] = {
+    "type": ["ja2en", "en2ja", "cloze", "contrast", "compose", "micro_drill"],
+    "result": ["correct", "hard", "wrong"],
+    "last_result": ["correct", "hard", "wrong"],
+    "form": ["exact", "lemma", "typo", "wrong_spelling"],
+    "sense": ["match", "mismatch", "unknown"],
+    "context": ["natural", "awkward", "conflict"],
+}
+_CODES = {k: {v: i for i, v in enumerate(vs)} for k, vs in ENUMS.items()}
+
+LEGEND = "\n".join([
+    "========================",
+    "【短縮スキーマ】",
+    "入力・出力とも JSON のキーは次の短縮形を使う（表に無いキーはそのまま）:",
+    ", ".join(f"{k}={v}" for k, v in KEYS.items()),
+    "列挙値は 0 始まりの番号で表す:",
+    *(f"- {k}: " + ", ".join(f"{i}={v}" for i, v in enumerate(vs)) for k, vs in ENUMS.items()),
+])
+
+
+def encode(obj: Any, _key: str = "") -> Any:
+    if isinstance(obj, dict):
+        return {KEYS.get(k, k): encode(v, k) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [encode(v, _key) for v in obj]
+    codes = _CODES.get(_key)
+    if codes is not None and isinstance(obj, str) and obj in codes:
+        return codes[obj]
+    return obj
+
+def decode(obj: Any, _key: str = "") -> Any:
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            k = _LONG.get(k, k)
+            out[k] = decode(v, k)
+        return out
+    if isinstance(obj, list):
+        return [decode(v, _key) for v in obj]
+    names = ENUMS.get(_key)
+    if names is not None and isinstance(obj, int) and not isinstance(obj, bool) and 0 <= obj < len(names):
+        return names[obj]
+    return obj
@@ -1,10 +1,18 @@
 # streamlit_app.py
-import os, io, time, json, base64, random
-from typing import Dict, Any, List
+import io, os, time, base64
+from typing import Dict, Any, List, Optional
 import streamlit as st
-from PIL import Image
 from pillow_heif import register_heif_opener
 from openai import OpenAI
+from srs.store import CardStore
+from srs.model import DEFAULT_SNAPSHOT_EVERY, Deck, approx_bytes
+from srs.prefetch import Prefetcher
+from srs import service, llm, analytics, archive, schedule
+from srs.enrich import ENRICH_SYSTEM_PROMPT
+from srs.cache import ResponseCache, make_key
+from srs.imageprep import PreparedImage, prepare
+from srs.ocr import ENGINES, TesseractOcr, make_engine
+from srs.metrics import METRICS
 
 # HEIC(HEIF) を Pillow で開けるように登録
 register_heif_opener()
@@ -22,7 +30,7 @@ SRS_SYSTEM_PROMPT = r"""
 - 回数（Stage）に応じて問題形式を自動切替
 - 多義語の意味分岐と近義語の文脈比較を厳密判定
 - 採点は「語形・語義・文脈」の3層で評価
-- 結果に応じて次回復習時刻とフォローアップを即時決定
+- 結果に応じてフォローアップを即時決定（次回復習時刻はアプリ側で計算する）
 
 ========================
 【前提・用語】
@@ -37,10 +45,6 @@ SRS_SYSTEM_PROMPT = r"""
 {
   "now": <number epoch_ms>,
   "config": {
-    "algo": "leitner|sm2",
-    "leitner_offsets_days": [1,3,7,14,30],
-    "wrong_delay_hours": 12,
-    "hard_delay_hours": 24,
     "session_max": 40,
     "min_mix_ratio": {"ja2en":0.25,"en2ja":0.25,"cloze":0.25,"contrast":0.25},
     "random_seed": 42,
@@ -70,7 +74,6 @@ SRS_SYSTEM_PROMPT = r"""
       "prompt":"私はこの問題にすぐ対処した。",
       "answer":"deal with",
       "tags":{"sense_id":"deal#handle"},
-      "due_at": 1735400000000,
       "last_result":"correct|wrong|hard|null"
     }
   ],
@@ -86,7 +89,7 @@ SRS_SYSTEM_PROMPT = r"""
 ========================
 【出力モード】
 - セッション開始（問題配布）: "mode":"serve"
-- 採点＋次回更新: "mode":"grade"
+- 採点: "mode":"grade"
 呼び分けは、入力に "user_answers" が無ければ serve、有れば grade とする。
 
 ========================
@@ -129,7 +132,6 @@ SRS_SYSTEM_PROMPT = r"""
         "register": "ok|mismatch"
       },
       "explanation": "なぜその判定か（日本語）",
-      "next": {"stage": <1..5>,"due_at": <epoch_ms>},
       "followups": [
         {
           "type":"contrast|cloze|ja2en|en2ja|micro_drill",
@@ -177,11 +179,7 @@ SRS_SYSTEM_PROMPT = r"""
 
 ========================
 【次回スケジューリング】
-- algo="leitner":
-  correct → stage+1 / due = now + offsets_days[stage-1]
-  hard    → stage据置 / due = now + hard_delay_hours
-  wrong   → stage-1 / due = now + wrong_delay_hours
-- algo="sm2"（簡易）もサポート
+- アプリ側（Leitner / SM-2）で result から決める。grade の出力に next は不要
 
 ========================
 【フォローアップ生成規則】
@@ -210,6 +208,7 @@ SRS_SYSTEM_PROMPT = r"""
 ========================
 【開始】
 入力に "user_answers" が無ければ serve、有れば grade を返す。
+入力JSONは2つの user メッセージに分けて送る（1つ目: config / words、2つ目: now / cards / user_answers）。2つを合わせて1つの入力として扱う。
 """
 
 # ==============================
@@ -224,7 +223,23 @@ if not _api_key:
     st.error("OPENAI_API_KEY が見つかりません。Streamlit Cloud の『Settings → Secrets』に OPENAI_API_KEY を設定してください。")
     st.stop()
 
-client = OpenAI(api_key=_api_key)
+@st.cache_resource
+def get_client(api_key: str) -> OpenAI:
+    # 接続プールごとプロセスで1つだけ作り、再実行のたびに作り直さない
+    return OpenAI(api_key=api_key)
+
+client = get_client(_api_key)
+
+# 応答キャッシュ（メモリLRU＋ディスク層）。SRS_CACHE_PATH を空にするとメモリのみ
+CACHE_PATH = os.getenv("SRS_CACHE_PATH", "srs_cache.db")
+LLM_CACHE_TTL_S = 7 * 24 * 3600
+OCR_CACHE_TTL_S = 30 * 24 * 3600
+
+@st.cache_resource
+def get_cache() -> ResponseCache:
+    return ResponseCache(max_entries=256, ttl_s=LLM_CACHE_TTL_S, disk_path=CACHE_PATH or None)
+
+cache = get_cache()
 
 def now_ms() -> int:
     return int(time.time() * 1000)
@@ -232,15 +247,18 @@ def now_ms() -> int:
 # ==============================
 # 3) OpenAI Vision OCR（Tesseract不要）
 # ==============================
-def ocr_with_openai(img: Image.Image) -> str:
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+def ocr_with_openai(data: bytes, mime: str = "image/jpeg") -> str:
+    # data は前処理済み（縮小・グレースケール・JPEG/WebP）の画像
+    key = make_key("ocr", "gpt-4o-mini", data)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    b64 = base64.b64encode(data).decode("utf-8")
     messages = [
         {"role":"system","content":"Extract plain text from the image. Return only raw text."},
         {"role":"user","content":[
             {"type":"input_text","text":"Please OCR this image and return plain text only."},
-            {"type":"input_image","image_url":{"url":f"data:image/png;base64,{b64}"}}
+            {"type":"input_image","image_url":{"url":f"data:{mime};base64,{b64}"}}
         ]}
     ]
     resp = client.chat.completions.create(
@@ -248,73 +266,62 @@ def ocr_with_openai(img: Image.Image) -> str:
         temperature=0,
         messages=messages
     )
-    return resp.choices[0].message.content.strip()
+    text = resp.choices[0].message.content.strip()
+    cache.put(key, text, ttl_s=OCR_CACHE_TTL_S)
+    return text
+
+@st.cache_resource
+def get_tesseract() -> TesseractOcr:
+    # プロセスプールはサーバ内で1つだけ持つ
+    return TesseractOcr(lang="eng+jpn", max_workers=2)
 
 # ==============================
 # 4) LLM JSON ユーティリティ
 # ==============================
 def llm_json(system_prompt: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0,
-        messages=[
-            {"role":"system","content":system_prompt},
-            {"role":"user","content":json.dumps(payload, ensure_ascii=False)}
-        ]
-    )
-    txt = resp.choices[0].message.content.strip()
-    try:
-        return json.loads(txt)
-    except Exception:
-        return {"mode":"serve","session":{"served_at":now_ms(),"items":[]}}
+    return llm.chat_json(client, system_prompt, payload, cache=cache, compact_wire=CFG["llm_compact_wire"])
 
 # ==============================
-# 5) 画像オープン（HEIC対応）
+# 5) 画像前処理（HEIC対応。再実行のたびに縮小し直さないようキャッシュ）
 # ==============================
-def _open_uploaded_image(uploaded) -> Image.Image:
-    # Streamlit の UploadedFile は bytes を返せる
-    data = uploaded.getvalue()
-    img = Image.open(io.BytesIO(data))
-    return img.convert("RGB")
+@st.cache_data(max_entries=8, show_spinner=False)
+def _prepare_upload(data: bytes) -> PreparedImage:
+    return prepare(data)
 
 # ==============================
-# 6) 簡易カード生成（OCRテキスト→語群→カード雛形）
+# 6) ストア（SQLite。プロセス内で共有し、サーバ再起動後も残る）
 # ==============================
-def bootstrap_from_text(text: str):
-    words = []
-    for line in text.splitlines():
-        token = line.strip().split(" ")[0]
-        if token.isalpha() and 2 <= len(token) <= 20:
-            words.append(token.lower())
-    words = list(dict.fromkeys(words))
-    t = now_ms()
-    st.session_state.WORDS += [{"headword": w, "senses": [], "contrast_pairs": []} for w in words]
-    for w in words:
-        st.session_state.CARDS.append({
-            "id": f"c_{w}_{t}_{random.randint(100,999)}",
-            "word": w,
-            "stage": 1,
-            "type": "en2ja",
-            "prompt": f"【和訳】{w}",
-            "answer": "",
-            "tags": {"sense_id": None},
-            "due_at": t,
-            "last_result": None
-        })
+DB_PATH = os.getenv("SRS_DB_PATH", "srs.db")
+
+@st.cache_resource
+def get_store(deck: str) -> CardStore:
+    return CardStore(DB_PATH, deck)
+
+@st.cache_resource
+def get_deck(deck: str) -> Deck:
+    # 索引つきのインメモリ・デッキ（書き込みはストアへそのまま反映）。全セッションで1つを共有
+    return Deck(get_store(deck))
+
+@st.cache_resource
+def get_prefetcher(deck: str) -> Prefetcher:
+    return Prefetcher(get_deck(deck))
 
 # ==============================
-# 7) セッション状態（疑似DB）
+# 7) セッション状態（出題キュー・解答バッファのみ）
 # ==============================
 st.set_page_config(page_title="単語SRS（写真→自動出題）", page_icon="📚", layout="wide")
 st.title("📚 単語SRS（写真→自動出題 / Streamlit Cloud 版）")
 
-if "WORDS" not in st.session_state: st.session_state.WORDS = []
-if "CARDS" not in st.session_state: st.session_state.CARDS = []
+if "DECK"  not in st.session_state: st.session_state.DECK  = "default"
+if not st.session_state.DECK: st.session_state.DECK = "default"   # 設定タブの入力を空にしたとき
 if "DUE"   not in st.session_state: st.session_state.DUE   = []
-if "ANS"   not in st.session_state: st.session_state.ANS   = []
+if "ANS"   not in st.session_state: st.session_state.ANS   = {}   # card_id -> 解答
+if "CHECKPOINT" not in st.session_state: st.session_state.CHECKPOINT = 0   # 前回のエクスポートのジャーナル位置
+
+store = get_deck(st.session_state.DECK)
 
-# SRS 設定
-CFG = {
+# SRS 設定（既定値）
+CFG_DEFAULTS = {
     "algo":"leitner",
     "leitner_offsets_days":[1,3,7,14,30],
     "wrong_delay_hours":12,
@@ -325,75 +332,216 @@ CFG = {
     "accept_spelling_distance":1,
     "accept_lemma":True,
     "accept_synonym_if_same_sense":True,
-    "lang":"ja"
+    "lang":"ja",
+    "serve_llm_phrasing":False,
+    "payload_token_budget":6000,
+    "llm_compact_wire":False,
+    "prefetch_next_session":True,
+    "enrich_on_import":True,
+    "enrich_batch_size":20,
+    "grade_chunk_size":5,
+    "followup_max_per_word":6,
+    "followup_max_per_sense":3,
+    "followup_retire_stage":3,
+    "journal_snapshot_every":DEFAULT_SNAPSHOT_EVERY,
+    "llm_max_concurrency":4,
+    "llm_rate_per_s":2.0,
+    "ocr_max_concurrency":4,
+    "ocr_engine":"hybrid",
+    "ocr_min_confidence":75
 }
+# 設定タブのウィジェットは key="cfg_<名前>" で値を session_state に持つ。ここ（出題・採点・取り込みの処理より前）で
+# 今回の実行の CFG に読み込むので、変えた設定がその後の操作にそのまま効く
+for _k, _v in CFG_DEFAULTS.items():
+    st.session_state.setdefault(f"cfg_{_k}", _v)
+st.session_state.setdefault("cfg_offsets_txt", ",".join(str(d) for d in CFG_DEFAULTS["leitner_offsets_days"]))
+try:
+    # 読めない入力のあいだは、最後に読めた間隔を使い続ける
+    st.session_state.cfg_leitner_offsets_days = ([float(x) for x in st.session_state.cfg_offsets_txt.split(",") if x.strip()]
+                                                 or st.session_state.cfg_leitner_offsets_days)
+    OFFSETS_OK = True
+except ValueError:
+    OFFSETS_OK = False
+CFG = {k: st.session_state[f"cfg_{k}"] for k in CFG_DEFAULTS}
+# what-if の比較基準（既定のスケジュール設定。再スケジュールを適用したらその設定に置き換える）
+if "SCHEDULE" not in st.session_state:
+    st.session_state.SCHEDULE = schedule.schedule_config(CFG)
+
+def get_ocr():
+    return make_engine(CFG["ocr_engine"], ocr_with_openai, get_tesseract(), CFG["ocr_min_confidence"])
+
+def _srs_llm(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return llm_json(SRS_SYSTEM_PROMPT, payload)
+
+def _enrich_llm(payload: Dict[str, Any]):
+    return llm.chat_json_plain(client, ENRICH_SYSTEM_PROMPT, payload, mode="enrich")
+
+def _srs_llm_stream(payload: Dict[str, Any]):
+    return llm.chat_json_stream(client, SRS_SYSTEM_PROMPT, payload, cache=cache,
+                                compact_wire=CFG["llm_compact_wire"])
 
 # ==============================
-# 8) serve / grade ロジック
+# 8) serve / grade / 取り込み
 # ==============================
+def enrich_words(headwords: List[str]):
+    # 語義・対比ペアの補完。結果は見出し語ごとに共有キャッシュへ置く（全セッション・再起動後も再利用）
+    if not headwords or not CFG["enrich_on_import"]:
+        return
+    bar = st.progress(0.0, text="語彙を補完中…")
+    def _on_progress(done, total):
+        bar.progress(done / max(1, total), text=f"語彙を補完中… {done}/{total}")
+    try:
+        r = service.enrich(store, CFG, headwords, _enrich_llm, cache=cache, tag=llm.MODEL, on_progress=_on_progress)
+    except Exception as e:
+        r = {"words": 0, "missing": len(headwords)}
+        st.caption(f"詳細: {e}")
+    bar.empty()
+    if r["missing"]:
+        st.warning(f"{r['missing']} 語は語義を補完できませんでした（カードの答えは空のままです）。")
+
+def bootstrap_from_text(text: str):
+    enrich_words(service.bootstrap_words(store, text, now_ms()))
+
+def _prefetch_key() -> str:
+    return make_key("prefetch", CFG)
+
+def prefetch_next(exclude=()):
+    # 次のセッションをバックグラウンドで用意する（出題中のカードは除く）。st.* には触れない
+    if not CFG.get("prefetch_next_session"):
+        return
+    cfg, ex = dict(CFG), set(exclude)
+    get_prefetcher(st.session_state.DECK).schedule(
+        _prefetch_key(), lambda: service.serve(store, cfg, now_ms(), _srs_llm, exclude=ex))
+
 def serve_session():
-    out = llm_json(SRS_SYSTEM_PROMPT, {
-        "now": now_ms(),
-        "config": CFG,
-        "words": st.session_state.WORDS,
-        "cards": st.session_state.CARDS
-    })
-    st.session_state.DUE = out.get("session",{}).get("items",[])
+    items = None
+    if CFG.get("prefetch_next_session"):
+        # 先読みは計算した時点の now で選んでいる。いま選び直した結果と一致するときだけ使う
+        items = get_prefetcher(st.session_state.DECK).take(
+            _prefetch_key(), expect=service.select_ids(store, CFG, now_ms()))
+    if items:
+        st.session_state.DUE = items
+    elif not CFG.get("serve_llm_phrasing"):
+        st.session_state.DUE = service.serve(store, CFG, now_ms(), _srs_llm)
+    else:
+        st.session_state.DUE = _serve_streaming()
+    # 解答しているあいだに次のセッションを先読みしておく
+    prefetch_next(exclude=[it["card_id"] for it in st.session_state.DUE])
+
+def _serve_streaming() -> List[Dict[str, Any]]:
+    # LLM 言い換え時はストリーミングで届いた問題から順に表示する
+    ph = st.empty()
+    items = []
+    with ph.container():
+        st.caption("出題を生成中…（届いた問題から表示）")
+        for it in service.serve_stream(store, CFG, now_ms(), _srs_llm_stream):
+            items.append(it)
+            st.markdown(f"{len(items)}. **[{it.get('type','')}]** {it.get('prompt','')}")
+    ph.empty()
+    return items
 
 def grade_session():
-    payload = {
-        "now": now_ms(),
-        "config": CFG,
-        "words": st.session_state.WORDS,
-        "cards": st.session_state.CARDS,
-        "user_answers": st.session_state.ANS
-    }
-    out = llm_json(SRS_SYSTEM_PROMPT, payload)
-    results = out.get("results",[])
-    card_map = {c["id"]: c for c in st.session_state.CARDS}
-    for r in results:
-        cid = r.get("card_id")
-        if cid in card_map:
-            card = card_map[cid]
-            nxt = r.get("next",{})
-            card["stage"] = nxt.get("stage", card["stage"])
-            card["due_at"] = nxt.get("due_at", card["due_at"])
-            card["last_result"] = r.get("result", card.get("last_result"))
-            # フォローアップをカード化
-            for f in r.get("followups",[]):
-                st.session_state.CARDS.append({
-                    "id": f"fu_{int(time.time()*1000)}",
-                    "word": card["word"],
-                    "stage": max(1, card["stage"]-1),
-                    "type": f.get("type","cloze"),
-                    "prompt": f.get("prompt",""),
-                    "answer": f.get("answer",""),
-                    "tags": f.get("tags",{}),
-                    "due_at": now_ms()+3600*1000,
-                    "last_result": None
-                })
-    st.session_state.ANS = []
-    st.success("採点完了・次回スケジュール更新")
+    bar = st.progress(0.0, text="採点中…")
+    _, failed = service.grade(store, CFG, list(st.session_state.ANS.values()), now_ms(), _srs_llm,
+                              on_progress=lambda done, total: bar.progress(done / total, text=f"採点中… {done}/{total}"))
+    bar.empty()
+    # 失敗したチャンクの解答だけ残して再採点できるようにする
+    st.session_state.ANS = {a["card_id"]: a for a in failed}
+    if failed:
+        st.warning(f"{len(failed)} 件は採点できませんでした。もう一度『採点』を押すと、その分だけ再送します。")
+    else:
+        st.success("採点完了・次回スケジュール更新")
+    snapshot_if_due()
+    # due_at が更新されたので、その状態で次のセッションを先読みする
+    prefetch_next()
+
+def reset_answers():
+    # 解答バッファと入力欄（ans_<card_id>）の両方を空にする。入力欄が残っていると前の解答が表示され、再送される
+    for k in [k for k in st.session_state if str(k).startswith("ans_")]:
+        del st.session_state[k]
+    st.session_state.ANS = {}
+
+def _record_answer(card_id: str):
+    ans = st.session_state.get(f"ans_{card_id}", "")
+    if ans:
+        st.session_state.ANS[card_id] = {"card_id": card_id, "user_input": ans, "latency_ms": 5000}
+    else:
+        st.session_state.ANS.pop(card_id, None)
+
+@st.fragment
+def quiz_item(it: Dict[str, Any]):
+    # 1問ずつフラグメントに分け、入力時はこの問題だけを再実行する（他のタブ・問題は描き直さない）
+    st.markdown(f"**[{it.get('type','')}] Stage {it.get('stage','?')}**")
+    st.write(it.get("prompt",""))
+    st.text_input(
+        f"解答（card_id={it.get('card_id')}）",
+        key=f"ans_{it.get('card_id')}",
+        on_change=_record_answer, args=(it.get("card_id"),)
+    )
 
 # ==============================
 # 9) データの保存/読み込み（JSON）
 # ==============================
-def export_json() -> str:
-    data = {"words": st.session_state.WORDS, "cards": st.session_state.CARDS}
-    return json.dumps(data, ensure_ascii=False, indent=2)
+def snapshot_if_due():
+    # 変更（ジャーナルのイベント）がたまったら索引・列のスナップショットを取り、古いイベントを詰める
+    if store.maybe_snapshot(now_ms(), int(CFG["journal_snapshot_every"])):
+        st.caption("スナップショットを保存しました（次回の起動はこの時点から再開します）。")
+
+def export_deck(since: Optional[int] = None) -> bytes:
+    # gzip NDJSON をメモリ上に書き出して圧縮済みのバイト列を返す（デッキ全体を文字列にしない・一時ファイルを残さない）
+    # since を渡すとそのチェックポイント以降の変更だけ（辿れなければ全体）
+    with io.BytesIO() as f:
+        counts = None
+        if since is not None:
+            counts = archive.export_changes(store, f, since, now_ms(), schedule=st.session_state.SCHEDULE)
+            if counts is None:
+                st.info(f"チェックポイント {since} 以前の履歴は整理済みのため、全体をエクスポートします。")
+        if counts is None:
+            counts = archive.export_deck(store, f, now_ms(), schedule=st.session_state.SCHEDULE)
+        data = f.getvalue()
+    st.session_state.CHECKPOINT = counts["checkpoint"]
+    deleted = f"・削除 {counts['deleted']}" if "deleted" in counts else ""
+    st.success(f"エクスポートを作成しました（語彙 {counts['words']} / カード {counts['cards']}{deleted}）。"
+               f"チェックポイント: {counts['checkpoint']}")
+    return data
+
+def import_deck(fp):
+    bar = st.progress(0.0, text="読み込み中…")
+    retimed = [0]
+
+    def _retime(ids, sched):
+        # エクスポート元と間隔・アルゴリズムが違えば、取り込んだカードの due をこちらの設定で付け直す（chunk ごと）
+        if sched and sched != st.session_state.SCHEDULE:
+            retimed[0] += service.reschedule(store, sched, st.session_state.SCHEDULE, ids=ids)
 
-def import_json(txt: str):
     try:
-        data = json.loads(txt)
-        st.session_state.WORDS = data.get("words", [])
-        st.session_state.CARDS = data.get("cards", [])
-        st.success("JSONを読み込みました。")
+        r = archive.import_deck(store, fp, on_progress=lambda done, total: bar.progress(
+            done / total if total else 1.0, text=f"読み込み中… {done // 1024} / {total // 1024} KB"), on_cards=_retime)
     except Exception as e:
-        st.error(f"JSONの読み込みに失敗: {e}")
+        st.error(f"読み込みに失敗: {e}")
+        return
+    bar.progress(1.0, text="完了")
+    deleted = f"・{r['deleted']} 枚を削除" if r["deleted"] else ""
+    st.success(f"語彙 {r['words']} / カード {r['cards']} を取り込みました（同じ id は上書き{deleted}）。")
+    if retimed[0]:
+        st.caption(f"スケジュール設定の違いに合わせて {retimed[0]} 枚の due を付け直しました。")
+    if r["invalid"]:
+        st.warning(f"不正なレコード {r['invalid']} 件をスキップしました。")
+        st.code("\n".join(r["errors"]))
+    if r["truncated"]:
+        st.warning(f"圧縮データが途中で切れているか壊れています（{r['truncated']}）。"
+                   f"読めた分（語彙 {r['words']} / カード {r['cards']}）だけ取り込みました。")
+    elif not r["complete"]:
+        st.warning("ファイルが途中で終わっています（末尾レコードなし）。読めた分だけ取り込みました。")
+    snapshot_if_due()
 
 # ==============================
 # 10) UI
 # ==============================
+# 開いた直後（出題前）にも最初のセッションを先読みしておく
+if not st.session_state.DUE:
+    prefetch_next()
+
 tab1, tab2, tab3, tab4 = st.tabs(["1) 写真取り込み", "2) 今日の出題", "3) データ", "4) 設定"])
 
 with tab1:
@@ -405,23 +553,62 @@ with tab1:
 
     col1, col2 = st.columns(2)
     with col1:
-        # ✅ HEICも受け付ける
-        img_file = st.file_uploader("画像を選択（JPG/PNG/HEIC）", type=["png","jpg","jpeg","heic"])
+        # ✅ HEICも受け付ける。複数枚なら一括取り込み
+        img_files = st.file_uploader("画像を選択（JPG/PNG/HEIC・複数可）", type=["png","jpg","jpeg","heic"],
+                                     accept_multiple_files=True)
     with col2:
         cam = st.camera_input("カメラで撮る", key="cam_input") if st.session_state.use_cam else None
 
+    if img_files and len(img_files) > 1:
+        # 複数ページ：前処理＋OCRを並列で回し、終わったページから順にカード化
+        st.caption(f"{len(img_files)} 枚を選択中（取り込み済みと同じページは自動でスキップ）")
+        if st.button(f"{len(img_files)} 枚を一括OCRしてカード作成", type="primary"):
+            bar = st.progress(0.0, text="取り込み中…")
+            log = st.container()
+            names = [f.name for f in img_files]
+            labels = {"imported": "✅ 取り込み", "duplicate": "⏭️ 重複スキップ", "error": "⚠️ 失敗"}
+            done = []
+
+            def _on_page(i, status, info):
+                done.append(i)
+                bar.progress(len(done) / len(names), text=f"取り込み中… {len(done)}/{len(names)}")
+                extra = f"（{info.get('words', 0)} 語）" if status == "imported" else info.get("error", "")
+                log.write(f"{labels[status]}: {names[i]} {extra}")
+
+            summary = service.import_pages(store, [f.getvalue() for f in img_files], get_ocr(),
+                                           now_ms(), CFG, on_page=_on_page)
+            bar.empty()
+            enrich_words(summary["headwords"])
+            snapshot_if_due()
+            st.success(f"{summary['imported']} ページ / {summary['words']} 語を取り込みました"
+                       f"（重複 {summary['duplicate']}・失敗 {summary['error']}）→ 『2) 今日の出題』へ")
+
     # ファイルがあれば優先。どちらもNoneなら何もしない
-    uploaded = img_file or cam
+    uploaded = (img_files[0] if len(img_files or []) == 1 else None) or cam
     if uploaded:
         try:
-            img = _open_uploaded_image(uploaded)
-            st.image(img, caption="プレビュー", use_column_width=True)
+            # Streamlit の UploadedFile は bytes を返せる
+            prep = _prepare_upload(uploaded.getvalue())
+            st.image(prep.thumb, caption="プレビュー", width="stretch")
+            st.caption(f"送信サイズ {prep.stats['out_bytes']/1024:.0f} KB"
+                       f"（元 {prep.stats['src_bytes']/1024:.0f} KB / {prep.stats['saved_bytes']/1024:.0f} KB 削減・"
+                       f"{prep.stats['out_size'][0]}×{prep.stats['out_size'][1]}）")
             if st.button("OCRしてカード作成", type="primary"):
                 with st.spinner("OCR中…"):
-                    text = ocr_with_openai(img)
-                st.text_area("OCR結果（編集OK）", text, height=200, key="OCR_TEXT")
+                    res = get_ocr().recognize(prep.data, prep.mime)
+                # 結果は次の再実行（下のボタンを押したとき）まで持ち越す。どのページの結果かは phash で見分ける
+                conf = f"・信頼度 {res.confidence:.0f}" if res.confidence is not None else ""
+                st.session_state.OCR_TEXT = res.text
+                st.session_state.OCR_PAGE = {"phash": prep.phash, "caption": f"OCRエンジン: {res.engine}{conf}"}
+            page = st.session_state.get("OCR_PAGE")
+            if page and page["phash"] == prep.phash:
+                st.caption(page["caption"])
+                st.text_area("OCR結果（編集OK）", height=200, key="OCR_TEXT")
                 if st.button("↑ このテキストからカード作成"):
-                    bootstrap_from_text(st.session_state.get("OCR_TEXT",""))
+                    bootstrap_from_text(st.session_state.get("OCR_TEXT", ""))
+                    store.add_page(prep.phash, now_ms())
+                    snapshot_if_due()
+                    st.session_state.OCR_PAGE = None
                     st.success("カードを作成しました → 『2) 今日の出題』へ")
         except Exception as e:
             st.error("画像を開けませんでした（形式未対応/破損の可能性）。別形式で試すか、もう一度撮影してください。")
@@ -435,51 +622,148 @@ with tab2:
     if c2.button("採点（grade）", type="secondary"):
         grade_session()
     if c3.button("解答リセット"):
-        st.session_state.ANS = []
+        reset_answers()
 
     st.write("---")
     if not st.session_state.DUE:
         st.info("出題キューが空です。カードの due_at を満たすと表示されます。")
     for it in st.session_state.DUE:
-        st.markdown(f"**[{it.get('type','')}] Stage {it.get('stage','?')}**")
-        st.write(it.get("prompt",""))
-        ans = st.text_input(
-            f"解答（card_id={it.get('card_id')}）",
-            key=f"ans_{it.get('card_id')}"
-        )
-        if ans:
-            # 既存解答があれば置換
-            st.session_state.ANS = [a for a in st.session_state.ANS if a["card_id"] != it["card_id"]]
-            st.session_state.ANS.append({"card_id": it["card_id"], "user_input": ans, "latency_ms": 5000})
+        quiz_item(it)
 
 with tab3:
     st.subheader("データの確認・バックアップ")
-    st.write("カード総数:", len(st.session_state.CARDS))
-    st.json({"WORDS_sample": st.session_state.WORDS[:5]})
-    st.json({"CARDS_sample": st.session_state.CARDS[:5]})
+    st.write("カード総数:", store.count_cards())
+    cols = store.columns()
+    if len(cols):
+        t = now_ms()
+        fc = analytics.due_forecast(cols, t)
+        backlog = analytics.overdue_backlog(cols, t)
+        c1, c2, c3 = st.columns(3)
+        c1.metric("期限切れ", backlog["total"])
+        c2.metric("24時間以内", sum(fc["hourly"][:24]))
+        c3.metric("30日以内", sum(fc["daily"]))
+        st.caption(f"期限切れの内訳：1日未満 {backlog['<1d']} / 1〜7日 {backlog['1-7d']} / 7日超 {backlog['>7d']}")
+        st.caption("段階（stage）分布")
+        st.bar_chart({"cards": analytics.stage_distribution(cols, len(CFG["leitner_offsets_days"]))})
+        st.caption("今後48時間の due（1時間ごと）")
+        st.bar_chart({"cards": fc["hourly"][:48]})
+        st.caption("今後30日の due（1日ごと）")
+        st.bar_chart({"cards": fc["daily"]})
+        st.json(analytics.breakdown(cols))
+    st.json({"WORDS_sample": store.sample_words(5)})
+    st.json({"CARDS_sample": store.sample_cards(5)})
 
     st.write("——")
-    st.download_button(
-        "📥 JSONエクスポート",
-        data=export_json().encode("utf-8"),
-        file_name="word_srs_data.json",
-        mime="application/json"
-    )
+    # 差分：前回のエクスポートのチェックポイント以降に変わった分だけ（別の端末で取ったものなら番号を入力）
+    since = st.number_input("前回のチェックポイント（差分エクスポート用）", 0, value=int(st.session_state.CHECKPOINT))
+    e1, e2 = st.columns(2)
+    full, delta = e1.button("📦 エクスポートを作成（全体）"), e2.button("📦 差分だけをエクスポート")
+    if full or delta:
+        st.session_state.EXPORT = export_deck(int(since) if delta else None)
+    if st.session_state.get("EXPORT"):
+        st.download_button(
+            "📥 エクスポートをダウンロード（gzip NDJSON）",
+            data=st.session_state.EXPORT,
+            file_name="word_srs_data.ndjson.gz",
+            mime="application/gzip"
+        )
     st.write("——")
-    up = st.file_uploader("📤 JSONインポート（エクスポートしたファイルを選択）", type=["json"], key="json_in")
+    up = st.file_uploader("📤 インポート（.ndjson.gz / 旧形式の .json）", type=["gz", "ndjson", "json"], key="json_in")
     if up:
-        txt = up.read().decode("utf-8")
-        if st.button("JSONを読み込む"):
-            import_json(txt)
+        if st.button("読み込む（同じ id はマージ）"):
+            import_deck(up)
 
 with tab4:
     st.subheader("設定（SRSパラメータ）")
-    st.caption("※ 変更後は出題/採点のたびに反映されます。")
-    CFG["algo"] = st.selectbox("アルゴリズム", ["leitner","sm2"], index=0)
-    CFG["session_max"] = st.slider("1セッションの最大出題数", 5, 50, CFG["session_max"])
-    CFG["wrong_delay_hours"] = st.slider("誤答の遅延（時間）", 1, 48, CFG["wrong_delay_hours"])
-    CFG["hard_delay_hours"] = st.slider("Hardの遅延（時間）", 1, 48, CFG["hard_delay_hours"])
-    st.write("間隔（days）:", CFG["leitner_offsets_days"])
+    st.text_input("デッキ名（同じ名前で再開できます）", key="DECK")
+    st.caption("※ 変更は次の操作（出題/採点/取り込み）から反映されます。")
+    st.selectbox("アルゴリズム", schedule.ALGOS, key="cfg_algo")
+    st.slider("1セッションの最大出題数", 5, 50, key="cfg_session_max")
+    st.slider("誤答の遅延（時間）", 1, 48, key="cfg_wrong_delay_hours")
+    st.slider("Hardの遅延（時間）", 1, 48, key="cfg_hard_delay_hours")
+    st.text_input("間隔（days、カンマ区切り）", key="cfg_offsets_txt")
+    if not OFFSETS_OK:
+        st.caption("※ 数値をカンマ区切りで入力してください（それまでは前の間隔を使います）。")
+
+    # what-if：今の間隔・遅延で付いた due を、上の設定で付け直したら30日の負荷がどう変わるか
+    base_schedule = st.session_state.SCHEDULE
+    new_schedule = {k: CFG[k] for k in base_schedule}
+    if new_schedule != base_schedule and store.count_cards():
+        cols = store.columns()
+        t = now_ms()
+        new_due = schedule.reschedule(cols, base_schedule, new_schedule)
+        st.caption("what-if：今後30日の due（現在の設定 → この設定）")
+        st.line_chart({"現在": analytics.due_forecast(cols, t)["daily"],
+                       "この設定": analytics.due_forecast(cols, t, due_at=new_due)["daily"]})
+        changed = schedule.changed_cards(cols, new_due)
+        if st.button(f"この設定で {len(changed)} 枚を再スケジュール"):
+            service.reschedule(store, base_schedule, new_schedule)
+            st.session_state.SCHEDULE = new_schedule
+            st.success("再スケジュールしました。")
+    st.toggle("出題文をLLMで言い換える（選定はローカル・届いた問題から順に表示）", key="cfg_serve_llm_phrasing")
+    st.toggle("次のセッションをバックグラウンドで先読みする", key="cfg_prefetch_next_session")
+    st.caption(f"先読みの状態: {get_prefetcher(st.session_state.DECK).status()}")
+
+    # 作業セット：カード・語彙の本体は上限までだけメモリに置き、あふれた分は使われていない順に捨てる（SQLite から読み直す）
+    # 上限はデッキ（全セッション共有）の設定。このセッションでスライダーを動かしたときだけ反映し、
+    # 再実行のたびに各セッションの値で上書きし合わないよう、表示は毎回いまの上限に合わせる
+    mem = store.memory()
+    st.session_state.MEMORY_MB = mem["max_bytes"] // 2**20
+    st.slider("作業セットの上限（MB・このデッキ）", 8, 512, step=8, key="MEMORY_MB",
+              on_change=lambda: store.set_memory_cap(st.session_state.MEMORY_MB * 2**20))
+    st.progress(min(1.0, mem["bytes"] / mem["max_bytes"]),
+                text=f"作業セット（本体） {mem['bytes'] / 2**20:.1f} / {mem['max_bytes'] / 2**20:.0f} MB"
+                     f"（カード {mem['cards']}/{mem['total_cards']}・語彙 {mem['words']}/{mem['total_words']} 件）")
+    st.caption(f"上限の外で常駐：索引 {mem['index_bytes'] / 2**20:.1f} MB・列 {mem['columns_bytes'] / 2**20:.1f} MB"
+               f"（合計 {(mem['bytes'] + mem['index_bytes'] + mem['columns_bytes']) / 2**20:.1f} MB）")
+    session_kb = approx_bytes({k: st.session_state.get(k) for k in ("DUE", "ANS")}) / 1024
+    st.caption(f"このセッションの出題・解答 {session_kb:.0f} KB / 読み直し {mem['misses']} 回・追い出し {mem['evictions']} 件")
+
+    # ジャーナル：変更はすべて追記し、この件数ごとにスナップショットを取って古い分を詰める（採点の履歴は残す）
+    st.number_input("スナップショットの間隔（変更イベント数）", 500, 100000, step=500, key="cfg_journal_snapshot_every")
+    js = store.journal_stats()
+    st.caption(f"ジャーナル 位置 {js['seq']}（最後のスナップショット {js['snapshot_seq']}）/ "
+               + "・".join(f"{k} {n}" for k, n in sorted(js["events"].items())))
+    if st.button("今すぐスナップショットを取る"):
+        st.success(f"位置 {store.snapshot(now_ms())} まで保存しました。")
+
+    st.slider("LLM入力JSONのトークン予算（1回あたり）", 1000, 32000, step=500, key="cfg_payload_token_budget")
+    st.toggle("LLMとの送受信に短縮スキーマを使う（キー短縮・列挙値を番号化）", key="cfg_llm_compact_wire")
+
+    st.slider("採点チャンクの解答数", 1, 20, key="cfg_grade_chunk_size")
+    # フォローアップ：同じ内容はまとめ、語・語義ごとの上限を超えたものは作らない。この段階以上で正解したら削除
+    f1, f2, f3 = st.columns(3)
+    f1.number_input("フォローアップ上限（1語あたり）", 0, 50, key="cfg_followup_max_per_word")
+    f2.number_input("フォローアップ上限（1語義あたり）", 0, 50, key="cfg_followup_max_per_sense")
+    f3.number_input("引退させる段階", 1, 5, key="cfg_followup_retire_stage")
+    if st.button("既存のフォローアップを整理（重複の統合・上限超過と習得済みの削除）"):
+        r = service.compact_followups(store, CFG)
+        st.success(f"{r['deleted']} 枚を削除・{r['updated']} 枚を更新しました。")
+    st.slider("LLM同時実行数", 1, 8, key="cfg_llm_max_concurrency")
+    st.toggle("取り込んだ語の語義・対比ペアをLLMで補完する", key="cfg_enrich_on_import")
+    st.slider("語彙補完の1回あたりの語数", 5, 50, step=5, key="cfg_enrich_batch_size")
+
+    st.selectbox("OCRエンジン（hybrid=ローカル優先・低信頼度のみVision）", ENGINES, key="cfg_ocr_engine")
+    st.slider("ローカルOCRを採用する最低信頼度", 0, 100, key="cfg_ocr_min_confidence")
+    if CFG["ocr_engine"] != "vision" and not get_tesseract().available():
+        st.caption("※ Tesseract が見つからないため Vision OCR を使います。")
 
     st.write("—— 開発者向け ——")
+    st.caption("応答キャッシュ（LLM/OCR）")
+    st.json(cache.stats())
+    spans = METRICS.summary()
+    if spans:
+        st.caption("計測（区間ごとの所要時間 ms。直近1000回の p50/p95/p99）")
+        st.dataframe(spans, width="stretch")
+        st.json(METRICS.counters())
+        st.download_button("📈 計測ログ（JSON Lines）", data=METRICS.export_jsonl().encode("utf-8"),
+                           file_name="word_srs_metrics.jsonl", mime="application/x-ndjson")
+    calls = llm.CALL_LOG.recent(20)
+    if calls:
+        prompt = sum(c.get("prompt_tokens") or 0 for c in calls)
+        cached = sum(c.get("cached_tokens") or 0 for c in calls)
+        if prompt:
+            st.caption(f"プロンプトキャッシュ：入力 {prompt} トークン中 {cached} トークンがキャッシュ済み（{cached / prompt:.0%}）")
+        st.caption("直近のLLM呼び出し（est_tokens=送信前の概算 / est_static_tokens=先頭の固定部分 / prompt_tokens・cached_tokens=API実測）")
+        st.dataframe(calls[::-1], width="stretch")
     st.code("Secrets に OPENAI_API_KEY を設定してください。", language="bash")
\ No newline at end of file
@@ -0,0 +1,20 @@
+import pytest
+
+from srs import service
+from srs.model import Deck
+from srs.store import CardStore
+
+WORDS = ["apple", "banana", "cherry", "grape", "lemon"]
+
+
+@pytest.fixture
+def deck():
+    d = Deck(CardStore(":memory:"))
+    service.bootstrap(d, "\n".join(WORDS), 0)
+    return d
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    # 別の接続から開き直す（起動時の復元）テスト用
+    return str(tmp_path / "srs.db")
@@ -0,0 +1,79 @@
+import io
+
+from srs import archive, service
+from srs.model import Deck
+from srs.store import CardStore
+
+
+def _dump(store):
+    return ({w["headword"]: w for w in map(dict, (w.to_dict() for w in store.iter_words()))},
+            {c["id"]: c.to_dict() for c in store.iter_cards()})
+
+
+def _export(store, **kw):
+    buf = io.BytesIO()
+    counts = archive.export_deck(store, buf, 0, **kw)
+    return buf, counts
+
+
+def test_full_round_trip(deck):
+    buf, counts = _export(deck, schedule={"algo": "sm2"})
+    assert (counts["words"], counts["cards"]) == (5, 5)
+    copy = Deck(CardStore(":memory:"))
+    got = []
+    r = archive.import_deck(copy, buf, chunk=2, on_cards=lambda ids, sched: got.append((ids, sched)))
+    assert r["complete"] and r["truncated"] is None and r["invalid"] == 0
+    assert (r["words"], r["cards"]) == (5, 5) and "card_ids" not in r
+    assert r["schedule"] == {"algo": "sm2"} and r["checkpoint"] == counts["checkpoint"]
+    assert sorted(i for ids, _ in got for i in ids) == sorted(deck.columns().ids)
+    assert all(sched == {"algo": "sm2"} for _, sched in got)
+    assert _dump(copy) == _dump(deck)
+    # 取り込んだ連番より後から払い出す
+    assert copy.new_id("c") not in deck.columns().ids
+
+
+def test_delta_export_applies_updates_and_deletes(deck):
+    buf, counts = _export(deck)
+    copy = Deck(CardStore(":memory:"))
+    archive.import_deck(copy, buf)
+
+    first, second = deck.columns().ids[:2]
+    deck.put_card(dict(deck.get_card(first).to_dict(), stage=3, due_at=123))
+    deck.delete_cards([second])
+    service.bootstrap(deck, "orange", 0)
+
+    delta = io.BytesIO()
+    ch = archive.export_changes(deck, delta, counts["checkpoint"])
+    assert (ch["words"], ch["cards"], ch["deleted"]) == (1, 2, 1)
+    r = archive.import_deck(copy, delta)
+    assert r["complete"] and r["deleted"] == 1
+    assert _dump(copy) == _dump(deck)
+
+
+def test_delta_export_needs_full_after_compaction(deck):
+    since = deck.last_seq()
+    deck.put_card(dict(deck.get_card(deck.columns().ids[0]).to_dict(), stage=2))
+    deck.snapshot(0)
+    deck.snapshot(0)
+    assert archive.export_changes(deck, io.BytesIO(), since) is None
+
+
+def test_truncated_gzip_is_reported_not_raised(deck):
+    data = _export(deck)[0].getvalue()
+    for cut in (20, len(data) // 2, len(data) - 5):
+        r = archive.import_deck(Deck(CardStore(":memory:")), io.BytesIO(data[:cut]), chunk=2)
+        assert not r["complete"]
+        assert r["truncated"]
+        assert r["cards"] <= 5
+
+
+def test_invalid_records_are_skipped(deck):
+    raw = (b'{"format":"word-srs","version":1}\n'
+           b'{"t":"card","d":{"id":"c_1","word":"apple","stage":"x"}}\n'
+           b'not json\n'
+           b'{"t":"card","d":{"id":"c_2","word":"apple"}}\n'
+           b'{"t":"end"}\n')
+    copy = Deck(CardStore(":memory:"))
+    r = archive.import_deck(copy, io.BytesIO(raw))
+    assert r["complete"] and r["cards"] == 1 and r["invalid"] == 2
+    assert list(copy.columns().ids) == ["c_2"]
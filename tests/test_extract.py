@@ -0,0 +1,41 @@
+import pytest
+
+from srs.extract import extract_headwords, headword_key
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1. deal with ～を扱う", ["deal with"]),
+    ("・look forward to doing ～を楽しみにする", ["look forward to"]),
+    ("take care of A  Aの世話をする", ["take care of"]),
+    ("issue n. 問題", ["issue"]),
+    ("by the way ところで", ["by the way"]),
+    ("as soon as ～するとすぐに", ["as soon as"]),
+    ("in spite of ～にもかかわらず", ["in spite of"]),
+    ("at least 少なくとも", ["at least"]),
+    ("be good at ～が得意だ", ["be good at"]),
+    ("in a word 要するに", ["in a word"]),
+])
+def test_headword_lines(text, expected):
+    assert extract_headwords(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "Please deal with the issue.",
+    "Take the bus to the station.",
+    "We will take the bus to the station tomorrow",
+    "the issue of",
+    "of",
+    "of A",
+])
+def test_sentences_and_fragments_are_skipped(text):
+    assert extract_headwords(text) == []
+
+
+def test_dedupe_is_case_and_space_only():
+    text = "News\nnews\nnew\nevening\neven\nDeal  with\ndeal with"
+    assert extract_headwords(text) == ["news", "new", "evening", "even", "deal with"]
+
+
+def test_headword_key():
+    assert headword_key("  Deal   With ") == "deal with"
+    assert headword_key("news") != headword_key("new")
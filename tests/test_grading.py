@@ -0,0 +1,59 @@
+import pytest
+
+from srs.grading import grade_form, known_forms, lemma, lemma_match, split_answers
+
+
+@pytest.mark.parametrize("answer, typed, form", [
+    ("deal with", "Deal with.", "exact"),
+    ("扱う/処理する", "処理する", "exact"),
+    ("walk", "walked", "lemma"),
+    ("hope", "hoping", "lemma"),
+    ("hop", "hopping", "lemma"),
+    ("study", "studies", "lemma"),
+    ("watch", "watches", "lemma"),
+    ("necessary", "neccessary", "typo"),
+    ("environment", "enviroment", "typo"),
+])
+def test_grade_form_accepts(answer, typed, form):
+    assert grade_form(answer, typed, {}) == form
+
+
+# 語尾を外すと別の語になる（ローカルで同じ語形とみなしてはいけない）
+@pytest.mark.parametrize("a, b", [
+    ("news", "new"), ("evening", "even"), ("during", "dur"), ("always", "alway"), ("species", "specy"),
+    ("string", "str"), ("nothing", "noth"), ("hate", "hat"), ("note", "not"),
+])
+def test_lemma_keeps_distinct_words(a, b):
+    assert not lemma_match(a, b)
+    assert lemma(a) != b
+
+
+@pytest.mark.parametrize("answer, typed", [
+    ("news", "new"), ("hate", "hat"), ("note", "not"),
+    ("affect", "effect"), ("advise", "advice"), ("than", "then"), ("status", "statue"),
+])
+def test_grade_form_leaves_other_words_to_llm(answer, typed):
+    assert grade_form(answer, typed, {}) is None
+
+
+@pytest.mark.parametrize("answer, typed", [("loose", "lose"), ("dessert", "desert")])
+def test_known_word_is_not_a_typo(answer, typed):
+    assert grade_form(answer, typed, {}) == "typo"
+    known = known_forms([{"headword": answer, "contrast_pairs": [{"a": answer, "b": typed}]}])
+    assert grade_form(answer, typed, {}, known) is None
+
+
+def test_spelling_distance_zero_disables_typo():
+    assert grade_form("necessary", "neccessary", {"accept_spelling_distance": 0}) is None
+
+
+def test_split_answers_routes_known_words_to_pending():
+    cards = {"c_1": {"id": "c_1", "type": "ja2en", "answer": "loose"},
+             "c_2": {"id": "c_2", "type": "ja2en", "answer": "loose"},
+             "c_3": {"id": "c_3", "type": "compose", "answer": "loose"}}
+    answers = [{"card_id": "c_1", "user_input": "lose"}, {"card_id": "c_2", "user_input": "loose"},
+               {"card_id": "c_3", "user_input": "loose"}, {"card_id": "c_9", "user_input": "x"}]
+    decided, pending = split_answers(answers, cards, 0, {}, known={"lose"})
+    assert [r["card_id"] for r in decided] == ["c_2"]
+    assert decided[0]["rubric"]["form"] == "exact" and decided[0]["result"] == "correct"
+    assert [a["card_id"] for a in pending] == ["c_1", "c_3"]
@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+
+from srs import service
+from srs.model import Deck
+from srs.store import CardStore
+
+
+def _state(d):
+    cards = d.get_cards(d.columns().ids)
+    return {i: (c["word"], c["stage"], c["due_at"]) for i, c in cards.items()}
+
+
+def test_recover_replays_journal_after_snapshot(db_path):
+    d = Deck(CardStore(db_path))
+    service.bootstrap(d, "apple\nbanana\ncherry", 0)
+    d.snapshot(1)
+    # スナップショットより後の変更（追加・更新・削除）
+    service.bootstrap(d, "grape", 0)
+    first, second = d.columns().ids[:2]
+    d.put_card(dict(d.get_card(first).to_dict(), stage=4, due_at=99))
+    d.delete_cards([second])
+
+    d2 = Deck(CardStore(db_path))
+    assert _state(d2) == _state(d)
+    assert d2.count_words() == d.count_words() == 4
+    assert sorted(d2.due_heads(10**13), key=lambda c: c["id"]) == sorted(d.due_heads(10**13), key=lambda c: c["id"])
+
+
+def test_unreadable_snapshot_falls_back_to_reload(db_path):
+    s = CardStore(db_path)
+    d = Deck(s)
+    service.bootstrap(d, "apple\nbanana", 0)
+    s.save_snapshot(s.last_seq(), b"not a snapshot", 0)
+    d2 = Deck(CardStore(db_path))
+    assert _state(d2) == _state(d)
+
+
+def test_catch_up_sees_writes_from_another_connection(db_path):
+    d = Deck(CardStore(db_path))
+    service.bootstrap(d, "apple", 0)
+    other = CardStore(db_path)
+    service.bootstrap(other, "banana", 0)
+    assert d.count_cards() == 1
+    assert d.catch_up() > 0
+    assert d.count_cards() == 2 and d.count_words() == 2
+    assert d.catch_up() == 0
+
+
+def test_changes_since_and_compaction(deck):
+    s = deck.store
+    start = s.last_seq()
+    cid = deck.columns().ids[0]
+    deck.put_card(dict(deck.get_card(cid).to_dict(), stage=3))
+    deck.delete_cards([deck.columns().ids[1]])
+    ch = s.changes_since(start)
+    assert ch["cards"] == [cid] and len(ch["deleted"]) == 1 and ch["words"] == []
+    deck.snapshot(0)
+    deck.snapshot(0)
+    assert s.changes_since(start) is None        # 詰めた範囲より前からは辿れない
+    assert s.changes_since(s.last_seq()) == {"since": s.last_seq(), "upto": s.last_seq(),
+                                            "words": [], "cards": [], "deleted": []}
+
+
+def test_reviews_survive_compaction(deck):
+    ids = list(deck.columns().ids[:2])
+    service.apply_results(deck, deck.get_cards(ids), [{"card_id": i, "result": "correct"} for i in ids], 1000, {})
+    deck.snapshot(0)
+    deck.snapshot(0)
+    assert [e["key"] for e in deck.store.events(kinds=["review"])] == ids
+
+
+def test_rollback_leaves_deck_untouched(deck):
+    cid = deck.columns().ids[0]
+    seen = []
+    deck.subscribe(seen.append)
+    with pytest.raises(RuntimeError):
+        with deck.batch():
+            deck.put_card(dict(deck.get_card(cid).to_dict(), stage=5))
+            deck.delete_cards([deck.columns().ids[1]])
+            raise RuntimeError
+    assert deck.get_card(cid)["stage"] == 1
+    assert deck.store.get_cards([cid])[cid]["stage"] == 1
+    assert deck.count_cards() == 5 and seen == []
+
+
+def test_write_does_not_deadlock_with_page_in(deck):
+    # 作業セットを空にしておき、読むたびにストアから読み直させる
+    deck.set_memory_cap(1)
+    ids = list(deck.columns().ids)
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            deck.get_cards(ids)
+            deck.get_words(["apple", "banana"])
+
+    def writer():
+        for k in range(100):
+            service.bootstrap(deck, f"word{chr(97 + k // 26)}{chr(97 + k % 26)}", 0)
+            service.apply_results(deck, deck.get_cards(ids), [{"card_id": i, "result": "correct"} for i in ids],
+                                  1000 + k, {})
+
+    readers = [threading.Thread(target=reader, daemon=True) for _ in range(2)]
+    for r in readers:
+        r.start()
+    w = threading.Thread(target=writer, daemon=True)
+    w.start()
+    w.join(10)
+    stop.set()
+    assert not w.is_alive()
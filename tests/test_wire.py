@@ -0,0 +1,27 @@
+from srs.wire import LEGEND, KEYS, decode, encode
+
+
+def test_round_trip():
+    payload = {
+        "now": 1, "config": {"session_max": 5},
+        "cards": [{"id": "c_1", "word": "deal with", "stage": 2, "type": "cloze", "last_result": "hard",
+                   "tags": {"sense_id": "deal with#handle"}, "extra_key": [1, 2]}],
+        "user_answers": [{"card_id": "c_1", "user_input": "deal with", "latency_ms": 900}],
+        "results": [{"card_id": "c_1", "result": "wrong", "score": 0.3,
+                     "rubric": {"form": "typo", "sense": "mismatch", "context": "awkward"}}],
+    }
+    assert decode(encode(payload)) == payload
+
+
+def test_keys_and_enums_are_shortened():
+    out = encode({"type": "cloze", "result": "correct", "prompt": "hard"})
+    assert out == {"t": 2, "r": 0, "p": "hard"}   # 列挙でないキーの値は番号にしない
+
+
+def test_decode_leaves_unknown_values():
+    assert decode({"t": 99, "r": True, "zz": 1}) == {"type": 99, "result": True, "zz": 1}
+
+
+def test_short_keys_are_unique_and_in_legend():
+    assert len(set(KEYS.values())) == len(KEYS)
+    assert all(f"{k}={v}" in LEGEND for k, v in KEYS.items())